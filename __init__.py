@@ -31,18 +31,29 @@ from .eaw_utility_operators import (EAWU_OT_ParentAllBones,
                                     EAWU_OT_RenameSelectedBones, 
                                     EAWU_OT_RenameByWeight, 
                                     EAWU_OT_RotateBones,
-                                    EAWU_OT_ScaleByReference)
-from .ui.eaw_utility_panel import EAWU_PT_Panel
+                                    EAWU_OT_ScaleByReference,
+                                    EAWU_OT_RunPipeline,
+                                    EAWU_OT_RotateBonesModal,
+                                    EAWU_OT_ParentAllBonesModal,
+                                    EAWU_OT_ScaleByReferenceModal,
+                                    EAWU_OT_ExportProfile,
+                                    EAWU_OT_ClearProfile)
+from .ui.eaw_utility_panel import (EAWU_PT_Panel, EAWU_PT_PerformancePanel, subscribePanelState, unsubscribePanelState, onDepsgraphUpdatePanel, onLoadPostPanel)
+from .ui.eaw_utility_overlay import (thresholdPreview, bonesInRangePreview, clearOverlaysOnLoad)
 from .ui.eaw_utility_weightlist import (EAWU_UL_WeightList, 
                                         EAWU_OT_WeightList_NewItem, 
                                         EAWU_OT_WeightList_DeleteItem, 
                                         EAWU_OT_WeightList_MoveItemUp, 
                                         EAWU_OT_WeightList_MoveItemDown)
-from .eaw_utility_properties import (EAWU_Properties, EAWU_WightlistItem)
+from .eaw_utility_properties import (EAWU_Properties, EAWU_WightlistItem, EAWU_CoverageItem)
+from .eaw_utility_geometry import (geometryCache, onDepsgraphUpdate, onLoadPost)
+from .eaw_utility_profiling import instrumentOperators
+from .eaw_utility_timers import (debouncer, clearTimersOnLoad)
 
 classes = (EAWU_OT_ParentAllBones, 
             EAWU_PT_Panel, 
             EAWU_WightlistItem, 
+            EAWU_CoverageItem, 
             EAWU_Properties, 
             EAWU_OT_SelectBonesRandomly, 
             EAWU_OT_RenameSelectedBones, 
@@ -53,18 +64,50 @@ classes = (EAWU_OT_ParentAllBones,
             EAWU_OT_WeightList_MoveItemDown,
             EAWU_OT_RenameByWeight,
             EAWU_OT_RotateBones,
-            EAWU_OT_ScaleByReference)
+            EAWU_OT_ScaleByReference,
+            EAWU_OT_RunPipeline,
+            EAWU_OT_RotateBonesModal,
+            EAWU_OT_ParentAllBonesModal,
+            EAWU_OT_ScaleByReferenceModal,
+            EAWU_OT_ExportProfile,
+            EAWU_OT_ClearProfile,
+            EAWU_PT_PerformancePanel)
 
 def register():
-    # Classes
+    # Classes (the operators record their timings)
+    instrumentOperators(classes)
     for cls in classes:
         bpy.utils.register_class(cls)
     
     # Properties
     bpy.types.Scene.eaw_utility = PointerProperty(type=EAWU_Properties)
 
+    # Handlers
+    bpy.app.handlers.depsgraph_update_post.append(onDepsgraphUpdate)
+    bpy.app.handlers.load_post.append(onLoadPost)
+    bpy.app.handlers.load_post.append(clearOverlaysOnLoad)
+    bpy.app.handlers.depsgraph_update_post.append(onDepsgraphUpdatePanel)
+    bpy.app.handlers.load_post.append(onLoadPostPanel)
+    bpy.app.handlers.load_post.append(clearTimersOnLoad)
+
+    # Panel Cache
+    subscribePanelState()
+
 
 def unregister():
+    # Handlers
+    bpy.app.handlers.depsgraph_update_post.remove(onDepsgraphUpdate)
+    bpy.app.handlers.load_post.remove(onLoadPost)
+    bpy.app.handlers.load_post.remove(clearOverlaysOnLoad)
+    bpy.app.handlers.depsgraph_update_post.remove(onDepsgraphUpdatePanel)
+    bpy.app.handlers.load_post.remove(onLoadPostPanel)
+    bpy.app.handlers.load_post.remove(clearTimersOnLoad)
+    unsubscribePanelState()
+    debouncer.clear()
+    geometryCache.clear()
+    thresholdPreview.clear()
+    bonesInRangePreview.clear()
+
     # Classes
     for cls in classes:
         bpy.utils.unregister_class(cls)
@@ -0,0 +1,62 @@
+# Benchmark for the parent/child matching used by "Parent Bones"
+#
+# Compares the old quadratic matching with the KDTree based matching
+# on synthetic armatures. Runs with plain Python (numpy KDTree) or inside Blender (mathutils KDTree):
+#   python benchmarks/bench_parent_bones.py [--sizes 1000 10000 50000] [--max-quadratic 50000]
+#   blender --background --python benchmarks/bench_parent_bones.py -- [--sizes 1000 10000 50000]
+
+import argparse
+import os
+import sys
+import time
+
+from math import dist
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic import (createRig, loadCore)
+
+def createSyntheticArmature(boneCount, parentRatio=0.1):
+    parentCount = max(1, int(boneCount * parentRatio))
+    return createRig(parentCount, boneCount - parentCount)
+
+def findParentMatchesQuadratic(parentNames, parentLocations, childNames, childLocations, distanceThreshold):
+    '''The matching as it was done before the spatial index'''
+    matches = []
+    for parentIndex, parentLocation in enumerate(parentLocations):
+        for childIndex, childLocation in enumerate(childLocations):
+            if childNames[childIndex] != parentNames[parentIndex]:
+                if dist(childLocation, parentLocation) <= distanceThreshold:
+                    matches.append((parentIndex, childIndex))
+                    break
+    return matches
+
+def timeIt(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - start, result
+
+def main():
+    argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else sys.argv[1:]
+    parser = argparse.ArgumentParser(description="Benchmark the Parent Bones matching")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--threshold", type=float, default=0.05)
+    parser.add_argument("--max-quadratic", type=int, default=50000, help="Skip the quadratic matching above this bone count")
+    args = parser.parse_args(argv)
+
+    core = loadCore()
+
+    print("%10s %10s %14s %14s %10s" % ("Bones", "Matches", "Quadratic (s)", "KDTree (s)", "Speedup"))
+    for size in args.sizes:
+        data = createSyntheticArmature(size)
+        kdTime, matches = timeIt(core.findParentMatches, *data, args.threshold)
+
+        if size <= args.max_quadratic:
+            quadraticTime, quadraticMatches = timeIt(findParentMatchesQuadratic, *data, args.threshold)
+            assert quadraticMatches == matches, "KDTree matching differs from the quadratic matching"
+            print("%10d %10d %14.4f %14.4f %9.1fx" % (size, len(matches), quadraticTime, kdTime, quadraticTime / max(kdTime, 1e-9)))
+        else:
+            print("%10d %10d %14s %14.4f %10s" % (size, len(matches), "skipped", kdTime, "-"))
+
+if __name__ == "__main__":
+    main()
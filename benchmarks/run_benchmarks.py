@@ -0,0 +1,158 @@
+# Benchmark suite for the EAW Utility algorithms
+#
+# Times the core of Parent Bones, Rotate Bones (normal lookup and orientation), Rename by Weight, getModelLength and the children coverage
+# on synthetic rigs and hulls of several sizes and compares them against stored baselines.
+# Runs with plain Python or inside Blender (then the mathutils KDTree is used):
+#   python benchmarks/run_benchmarks.py [--quick] [--tolerance 0.25] [--update-baseline]
+#   blender --background --python benchmarks/run_benchmarks.py -- [--quick]
+#
+# Exits with 1 if a benchmark got slower than its baseline by more than the tolerance and by more than
+# --min-difference seconds, so timer noise on sub-millisecond benchmarks is not reported as a regression.
+
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic import (createHull, createRig, loadCore)
+
+core = loadCore()
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+
+# (hardpoints, particles)
+RIG_SIZES = [(100, 900), (1000, 9000), (5000, 45000)]
+# (hull vertices, rotated bones)
+HULL_SIZES = [(10000, 1000), (50000, 1000), (200000, 1000)]
+EXTENT_SIZES = [100000, 500000, 2000000]
+NAME_COUNTS = [2000, 20000, 200000]
+BONE_COUNTS = [1000, 10000, 100000]
+
+def parentMatching(size):
+    hardpoints, particles = size
+    data = createRig(hardpoints, particles)
+    return lambda: core.findParentMatches(*data, 0.05)
+
+def childrenCoverage(size):
+    hardpoints, particles = size
+    data = createRig(hardpoints, particles)
+    thresholds = [i * 0.01 for i in range(100)]
+
+    # Build once, then one query per slider step
+    def run():
+        sortedDistances = core.closestChildDistances(*data)
+        for threshold in thresholds:
+            core.countInRange(sortedDistances, threshold)
+    return run
+
+def closestNormals(size):
+    vertexCount, boneCount = size
+    coordinates, normals = createHull(vertexCount)
+    rng = random.Random(0)
+    locations = [coordinates[rng.randrange(vertexCount)] * 1.01 for _ in range(boneCount)]
+
+    # The KDTree is built on the first run like an empty geometry cache
+    return lambda: core.findClosestNormals(locations, [(core.buildKDTree(coordinates), normals)])
+
+def boneOrientation(size):
+    normals = np.random.default_rng(0).normal(size=(size, 3))
+    return lambda: core.orientBones(normals, "Z_AXIS")
+
+def weightedNames(size):
+    names = ["Fire_" + str(i) for i in range(5)]
+    weights = [0.4, 0.25, 0.15, 0.15, 0.05]
+    # Equal names get their .001 suffixes before the rename, which is the main cost of Rename by Weight
+    return lambda: core.uniqueBoneNames(core.assignWeightedNames(names, weights, size, 0), [])
+
+def modelLength(size):
+    coordinates, _ = createHull(size)
+    return lambda: core.axisExtent(coordinates, core.AXIS_INDICES["Y_AXIS"])
+
+BENCHMARKS = [
+    ("parent_matching", parentMatching, RIG_SIZES, lambda size: size[0] + size[1]),
+    ("children_coverage", childrenCoverage, RIG_SIZES, lambda size: size[0] + size[1]),
+    ("closest_normals", closestNormals, HULL_SIZES, lambda size: size[0]),
+    ("model_length", modelLength, EXTENT_SIZES, lambda size: size),
+    ("weighted_names", weightedNames, NAME_COUNTS, lambda size: size),
+    ("bone_orientation", boneOrientation, BONE_COUNTS, lambda size: size),
+]
+
+def timeBest(function, repeats : int) -> float:
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def kdtreeImplementation() -> str:
+    return "numpy" if core.MathutilsKDTree == None else "mathutils"
+
+def main():
+    argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else sys.argv[1:]
+    parser = argparse.ArgumentParser(description="Benchmark the EAW Utility algorithms")
+    parser.add_argument("--quick", action="store_true", help="Only run the smallest size of every benchmark")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown against the baseline (0.25 = 25%%)")
+    parser.add_argument("--min-difference", type=float, default=0.002, help="Slowdowns below this many seconds are never a regression")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--update-baseline", action="store_true", help="Store the results as the new baseline")
+    parser.add_argument("--output", default=None, help="Write the results as JSON")
+    args = parser.parse_args(argv)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+    if baseline and baseline.get("kdtree") != kdtreeImplementation():
+        print("Warning: The baseline was recorded with the", baseline.get("kdtree"), "KDTree, this run uses", kdtreeImplementation())
+    baselineResults = baseline.get("results", {})
+
+    results = {}
+    regressions = []
+    print("%-34s %12s %12s %9s" % ("Benchmark", "Time (s)", "Baseline (s)", "Change"))
+    for name, setup, sizes, label in BENCHMARKS:
+        for size in (sizes[:1] if args.quick else sizes):
+            key = name + "[" + str(label(size)) + "]"
+            seconds = timeBest(setup(size), args.repeats)
+            results[key] = seconds
+
+            if key in baselineResults:
+                change = seconds / baselineResults[key] - 1
+                flag = ""
+                if change > args.tolerance and seconds - baselineResults[key] > args.min_difference:
+                    regressions.append(key)
+                    flag = "  REGRESSION"
+                print("%-34s %12.4f %12.4f %+8.0f%%%s" % (key, seconds, baselineResults[key], change * 100, flag))
+            else:
+                print("%-34s %12.4f %12s %9s" % (key, seconds, "-", "-"))
+
+    report = {
+        "kdtree" : kdtreeImplementation(),
+        "python" : platform.python_version(),
+        "machine" : platform.machine(),
+        "results" : results,
+    }
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=4)
+    if args.update_baseline:
+        # Keep the baselines of benchmarks which did not run (e.g. with --quick)
+        report["results"] = dict(baselineResults, **results)
+        with open(args.baseline, "w") as file:
+            json.dump(report, file, indent=4, sort_keys=True)
+        print("Baseline written to", args.baseline)
+
+    if regressions and not args.update_baseline:
+        print(len(regressions), "benchmarks are slower than their baseline:", ", ".join(regressions))
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+# Reproducible synthetic rigs and hull meshes for the benchmarks
+
+import importlib.util
+import os
+import random
+
+import numpy as np
+
+ADDON_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Half size of the box the bones and the hull are placed in, roughly a capital ship
+SHIP_SIZE = (100.0, 300.0, 50.0)
+
+def loadCore():
+    '''Imports eaw_utility_core on its own, it does not need bpy'''
+    spec = importlib.util.spec_from_file_location("eaw_utility_core", os.path.join(ADDON_DIR, "eaw_utility_core.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def randomLocation(rng : random.Random):
+    return (rng.uniform(-SHIP_SIZE[0], SHIP_SIZE[0]), rng.uniform(-SHIP_SIZE[1], SHIP_SIZE[1]), rng.uniform(-SHIP_SIZE[2], SHIP_SIZE[2]))
+
+def createRig(hardpointCount : int, particleCount : int, seed : int = 0):
+    '''HP_ hardpoint bones and P_ particle bones. The first particles sit right next to a hardpoint,
+    the others are spread over the ship. Returns (parentNames, parentLocations, childNames, childLocations)'''
+    rng = random.Random(seed)
+    parentNames = []
+    parentLocations = []
+    children = []
+
+    for i in range(hardpointCount):
+        location = randomLocation(rng)
+        parentNames.append("HP_" + str(i))
+        parentLocations.append(location)
+        if i < particleCount:
+            children.append(("P_" + str(i), (location[0] + rng.uniform(-0.01, 0.01), location[1], location[2])))
+
+    for i in range(len(children), particleCount):
+        children.append(("P_" + str(i), randomLocation(rng)))
+
+    # Bones are not sorted by location in a real armature
+    rng.shuffle(children)
+    childNames = [name for (name, _) in children]
+    childLocations = [location for (_, location) in children]
+
+    return parentNames, parentLocations, childNames, childLocations
+
+def createHull(vertexCount : int, seed : int = 0):
+    '''Vertices and normals on the surface of an ellipsoid around the rig as (n, 3) float32 arrays'''
+    rng = np.random.default_rng(seed)
+    directions = rng.normal(size=(vertexCount, 3))
+    directions /= np.linalg.norm(directions, axis=1, keepdims=True)
+    radii = np.array(SHIP_SIZE)
+    coordinates = directions * radii
+    # The gradient of the ellipsoid equation is the surface normal
+    normals = coordinates / (radii ** 2)
+    normals /= np.linalg.norm(normals, axis=1, keepdims=True)
+    return coordinates.astype(np.float32), normals.astype(np.float32)
@@ -0,0 +1,234 @@
+# Run EAW Utility operators over many .blend files without the UI
+#
+# Controller (starts one Blender instance per file, several in parallel):
+#   blender --background --python eaw_utility_batch.py -- --job job.json --files "units/**/*.blend" --workers 4 --report report.json
+#
+# Job spec:
+#   {
+#       "armature": "Armature",                       (optional, default: the first armature)
+#       "save": true,                                 (optional, save the files after all operations finished)
+#       "properties": {"distanceThreshold": 0.1},     (optional, EAWU_Properties values for all operations)
+#       "operations": [
+#           {"operator": "object.parent_all_bones"},
+#           {"operator": "object.rotate_bones", "select": "P_*", "properties": {"facingAxis": "Z_AXIS"}}
+#       ]
+#   }
+#
+# "select" is a fnmatch pattern for the bones which should be selected before the operator runs.
+# "mode" overrides the mode the armature is put into, by default operators which work on selected bones run in EDIT mode.
+# Weightlists are given as "renameWeightList": [{"value": "Name1", "weight": 0.8}, ...]
+
+import argparse
+import glob
+import importlib
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+
+from concurrent.futures import ThreadPoolExecutor
+from fnmatch import fnmatchcase
+
+try:
+    import bpy
+except ImportError:
+    # The controller can run without Blender, only the workers need bpy
+    bpy = None
+
+ADDON_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Operators working on context.selected_bones
+EDIT_MODE_OPERATORS = {"object.rename_selected_bones", "object.rename_by_weight", "object.rotate_bones"}
+
+###################################
+# Worker: runs inside one Blender #
+###################################
+
+def ensureAddonRegistered():
+    if hasattr(bpy.types.Scene, "eaw_utility"):
+        return
+
+    spec = importlib.util.spec_from_file_location("eaw_utility", os.path.join(ADDON_DIR, "__init__.py"), submodule_search_locations=[ADDON_DIR])
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["eaw_utility"] = module
+    spec.loader.exec_module(module)
+    module.register()
+
+def applyProperties(properties, values : dict):
+    for name, value in values.items():
+        if name == "renameWeightList":
+            properties.renameWeightList.clear()
+            for entry in value:
+                item = properties.renameWeightList.add()
+                item.value = entry["value"]
+                item.weight = entry["weight"]
+        else:
+            setattr(properties, name, value)
+
+def findArmature(scene, name):
+    for obj in scene.objects:
+        if obj.type == "ARMATURE" and (name == None or obj.name == name):
+            return obj
+    return None
+
+def getOperator(idname : str):
+    category, name = idname.split(".")
+    return getattr(getattr(bpy.ops, category), name)
+
+def runOperator(idname : str, armatureObject, selectedBones):
+    override = {
+        "object" : armatureObject,
+        "active_object" : armatureObject,
+        "selected_objects" : [armatureObject],
+        "selected_bones" : selectedBones,
+        "selected_editable_bones" : selectedBones,
+    }
+    operator = getOperator(idname)
+
+    # Context.temp_override exists since Blender 3.2
+    if hasattr(bpy.context, "temp_override"):
+        with bpy.context.temp_override(**override):
+            return operator()
+    return operator(override)
+
+def runOperation(scene, armatureObject, operation : dict):
+    idname = operation["operator"]
+    bpy.context.view_layer.objects.active = armatureObject
+    applyProperties(scene.eaw_utility, operation.get("properties", {}))
+
+    mode = operation.get("mode", "EDIT" if idname in EDIT_MODE_OPERATORS else "OBJECT")
+    bpy.ops.object.mode_set(mode=mode, toggle=False)
+
+    selectedBones = []
+    if mode == "EDIT":
+        pattern = operation.get("select")
+        for editBone in armatureObject.data.edit_bones:
+            if pattern != None:
+                editBone.select = fnmatchcase(editBone.name, pattern)
+                editBone.select_head = editBone.select
+                editBone.select_tail = editBone.select
+            if editBone.select:
+                selectedBones.append(editBone)
+
+    start = time.perf_counter()
+    result = runOperator(idname, armatureObject, selectedBones)
+    seconds = time.perf_counter() - start
+
+    if armatureObject.mode != "OBJECT":
+        bpy.ops.object.mode_set(mode="OBJECT", toggle=False)
+
+    return {
+        "operator" : idname,
+        "result" : sorted(result),
+        "seconds" : seconds,
+        "bones" : len(armatureObject.data.bones),
+        "selectedBones" : len(selectedBones),
+    }
+
+def runWorker(jobPath : str, resultPath : str):
+    with open(jobPath) as file:
+        job = json.load(file)
+
+    report = {"file" : bpy.data.filepath, "operations" : [], "error" : None}
+    start = time.perf_counter()
+    try:
+        ensureAddonRegistered()
+        scene = bpy.context.scene
+        armatureObject = findArmature(scene, job.get("armature"))
+        if armatureObject == None:
+            raise RuntimeError("No armature found")
+
+        # Property updates like the bones in range read the active object
+        bpy.context.view_layer.objects.active = armatureObject
+        applyProperties(scene.eaw_utility, job.get("properties", {}))
+
+        for operation in job["operations"]:
+            report["operations"].append(runOperation(scene, armatureObject, operation))
+
+        if job.get("save", False):
+            bpy.ops.wm.save_mainfile()
+    except Exception:
+        report["error"] = traceback.format_exc()
+    report["seconds"] = time.perf_counter() - start
+
+    with open(resultPath, "w") as file:
+        json.dump(report, file, indent=4)
+
+    return report["error"] == None
+
+##############################################
+# Controller: one Blender instance per file  #
+##############################################
+
+def processFile(blender : str, jobPath : str, blendFile : str):
+    with tempfile.TemporaryDirectory() as directory:
+        resultPath = os.path.join(directory, "result.json")
+        command = [blender, "--background", "--factory-startup", blendFile, "--python", os.path.abspath(__file__), "--",
+                   "--worker", "--job", jobPath, "--result", resultPath]
+
+        start = time.perf_counter()
+        process = subprocess.run(command, capture_output=True, text=True)
+        seconds = time.perf_counter() - start
+
+        report = {"file" : blendFile, "operations" : [], "error" : None}
+        if os.path.exists(resultPath):
+            with open(resultPath) as file:
+                report = json.load(file)
+        else:
+            report["error"] = process.stderr[-2000:] or "The worker did not write a result"
+
+    report["file"] = blendFile
+    report["returncode"] = process.returncode
+    report["wallSeconds"] = seconds
+    return report
+
+def runController(args):
+    files = sorted(set(file for pattern in args.files for file in glob.glob(pattern, recursive=True)))
+    jobPath = os.path.abspath(args.job)
+    blender = args.blender or (bpy.app.binary_path if bpy != None else "blender")
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        reports = list(executor.map(lambda blendFile: processFile(blender, jobPath, blendFile), files))
+
+    summary = {
+        "job" : jobPath,
+        "files" : reports,
+        "failed" : [report["file"] for report in reports if report["error"] != None],
+        "totalSeconds" : time.perf_counter() - start,
+    }
+    with open(args.report, "w") as file:
+        json.dump(summary, file, indent=4)
+
+    for report in reports:
+        status = "FAILED" if report["error"] != None else "OK"
+        print("%-8s %8.2fs  %s" % (status, report["wallSeconds"], report["file"]))
+    print("Processed", len(reports), "files in", round(summary["totalSeconds"], 2), "seconds,", len(summary["failed"]), "failed")
+
+    return len(summary["failed"]) == 0
+
+def main():
+    argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else sys.argv[1:]
+    parser = argparse.ArgumentParser(description="Run EAW Utility operators over many .blend files")
+    parser.add_argument("--job", required=True, help="JSON job spec")
+    parser.add_argument("--files", nargs="+", default=[], help="Glob patterns of the .blend files")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Count of parallel Blender instances")
+    parser.add_argument("--report", default="eaw_batch_report.json", help="Where the timing and result report is written")
+    parser.add_argument("--blender", default=None, help="Blender executable, defaults to the running Blender")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--result", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        success = runWorker(args.job, args.result)
+    else:
+        success = runController(args)
+
+    sys.exit(0 if success else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,640 @@
+# The algorithms behind the EAW Utility operators. This module only depends on numpy
+# (bpy and mathutils are optional) so it can be tested and benchmarked without Blender.
+
+import csv
+
+import heapq
+
+import random
+
+import re
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from math import (atan2, asin, floor, sqrt)
+
+try:
+    from mathutils.kdtree import KDTree as MathutilsKDTree
+except ImportError:
+    MathutilsKDTree = None
+
+AXIS_INDICES = {"X_AXIS" : 0, "Y_AXIS" : 1, "Z_AXIS" : 2}
+
+###################################
+# Spatial Index                   #
+###################################
+
+class KDTree:
+    '''Static KD-tree over (n, 3) points with the same find, find_n and find_range
+    methods as mathutils.kdtree.KDTree. Used when mathutils is not available'''
+
+    def __init__(self, points, leafSize : int = 16):
+        self.points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        self.order = np.arange(len(self.points))
+        # Every node is (start, end, left, right, lo, hi), leaves have no children
+        self.nodes = []
+        if len(self.points) > 0:
+            self.build(0, len(self.points), leafSize)
+
+    def build(self, start : int, end : int, leafSize : int) -> int:
+        points = self.points[self.order[start:end]]
+        lo = tuple(points.min(axis=0))
+        hi = tuple(points.max(axis=0))
+        nodeIndex = len(self.nodes)
+        self.nodes.append(None)
+
+        left = right = -1
+        if end - start > leafSize:
+            # Split along the widest axis at the median
+            axis = int(np.argmax(np.subtract(hi, lo)))
+            middle = (end - start) // 2
+            partition = np.argpartition(points[:, axis], middle)
+            self.order[start:end] = self.order[start:end][partition]
+            left = self.build(start, start + middle, leafSize)
+            right = self.build(start + middle, end, leafSize)
+
+        self.nodes[nodeIndex] = (start, end, left, right, lo, hi)
+        return nodeIndex
+
+    @staticmethod
+    def boxDistanceSquared(co, lo, hi) -> float:
+        distance = 0.0
+        for i in range(3):
+            if co[i] < lo[i]:
+                distance += (lo[i] - co[i]) ** 2
+            elif co[i] > hi[i]:
+                distance += (co[i] - hi[i]) ** 2
+        return distance
+
+    def leafDistances(self, node, co):
+        indices = self.order[node[0]:node[1]]
+        return indices, np.sqrt(((self.points[indices] - co) ** 2).sum(axis=1))
+
+    def find_n(self, co, n : int):
+        '''The n closest points as list of (co, index, distance), closest first'''
+        if not self.nodes or n <= 0:
+            return []
+
+        co = (float(co[0]), float(co[1]), float(co[2]))
+        # Max heap of the best candidates as (-distance, index)
+        best = []
+        stack = [0]
+        while stack:
+            node = self.nodes[stack.pop()]
+            boxDistance = sqrt(self.boxDistanceSquared(co, node[4], node[5]))
+            if len(best) == n and boxDistance > -best[0][0]:
+                continue
+
+            if node[2] == -1:
+                indices, distances = self.leafDistances(node, co)
+                for index, distance in zip(indices.tolist(), distances.tolist()):
+                    if len(best) < n:
+                        heapq.heappush(best, (-distance, index))
+                    elif distance < -best[0][0]:
+                        heapq.heapreplace(best, (-distance, index))
+            else:
+                # Visit the closer child first (it is pushed last)
+                left, right = self.nodes[node[2]], self.nodes[node[3]]
+                if self.boxDistanceSquared(co, left[4], left[5]) <= self.boxDistanceSquared(co, right[4], right[5]):
+                    stack.extend((node[3], node[2]))
+                else:
+                    stack.extend((node[2], node[3]))
+
+        return [(self.points[index], index, -distance) for (distance, index) in sorted(best, reverse=True)]
+
+    def find(self, co):
+        '''The closest point as (co, index, distance) or (None, None, None) if the tree is empty'''
+        found = self.find_n(co, 1)
+        return found[0] if found else (None, None, None)
+
+    def find_range(self, co, radius : float):
+        '''All points within the radius as list of (co, index, distance)'''
+        if not self.nodes:
+            return []
+
+        co = (float(co[0]), float(co[1]), float(co[2]))
+        found = []
+        stack = [0]
+        while stack:
+            node = self.nodes[stack.pop()]
+            if self.boxDistanceSquared(co, node[4], node[5]) > radius * radius:
+                continue
+
+            if node[2] == -1:
+                indices, distances = self.leafDistances(node, co)
+                inRange = distances <= radius
+                found.extend((self.points[index], index, distance) for index, distance in zip(indices[inRange].tolist(), distances[inRange].tolist()))
+            else:
+                stack.extend((node[2], node[3]))
+
+        return found
+
+def buildKDTree(locations):
+    '''Builds a KDTree over the locations, the index of each entry is the index in locations.
+    Uses mathutils.kdtree when it is available'''
+    if MathutilsKDTree == None:
+        return KDTree(locations)
+
+    locations = np.asarray(locations, dtype=np.float64).reshape(-1, 3).tolist()
+    tree = MathutilsKDTree(len(locations))
+    for index, location in enumerate(locations):
+        tree.insert(location, index)
+    tree.balance()
+    return tree
+
+class SpatialHashGrid:
+    '''Buckets locations into cubes with the edge length of the cell size.
+    Two locations closer than the cell size are always in the same or in neighbouring cubes'''
+
+    def __init__(self, cellSize : float):
+        self.cellSize = cellSize
+        self.cells = {}
+
+    def cellOf(self, location):
+        return (floor(location[0] / self.cellSize), floor(location[1] / self.cellSize), floor(location[2] / self.cellSize))
+
+    def insert(self, location):
+        self.cells.setdefault(self.cellOf(location), []).append(location)
+
+    def hasLocationWithin(self, location, distance : float):
+        '''True if an inserted location is closer than distance (distance must not exceed the cell size)'''
+        x, y, z = self.cellOf(location)
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                for dz in (-1, 0, 1):
+                    for other in self.cells.get((x + dx, y + dy, z + dz), ()):
+                        if (other[0] - location[0]) ** 2 + (other[1] - location[1]) ** 2 + (other[2] - location[2]) ** 2 < distance * distance:
+                            return True
+        return False
+
+def mapParallel(function, items, maxWorkers : int = None):
+    '''function applied to every item on a thread pool, the results are in the order of items.
+    Only pass read-only work on plain arrays, bpy data must not be touched from the threads'''
+    items = list(items)
+    if len(items) <= 1:
+        return [function(item) for item in items]
+
+    with ThreadPoolExecutor(max_workers=maxWorkers) as executor:
+        return list(executor.map(function, items))
+
+def startParallel(function, items, maxWorkers : int = None):
+    '''Starts function for every item on a thread pool without waiting for the results. Returns the executor,
+    which has to be shut down by the caller, and the futures in the order of items. The same rules as for mapParallel apply'''
+    executor = ThreadPoolExecutor(max_workers=maxWorkers)
+    return executor, [executor.submit(function, item) for item in items]
+
+###################################
+# Parent Bones                    #
+###################################
+
+def findParentMatches(parentNames, parentLocations, childNames, childLocations, distanceThreshold : float):
+    '''Matches every parent with the first child (lowest index) inside the distance threshold.
+    Returns a list of (parentIndex, childIndex) tuples'''
+    matches = []
+    if len(childLocations) == 0:
+        return matches
+
+    # Build the index once and query it for every parent
+    tree = buildKDTree(childLocations)
+    for parentIndex, parentLocation in enumerate(parentLocations):
+        parentName = parentNames[parentIndex]
+        childIndices = [index for (_, index, _) in tree.find_range(parentLocation, distanceThreshold) if childNames[index] != parentName]
+
+        if childIndices:
+            matches.append((parentIndex, min(childIndices)))
+
+    return matches
+
+def closestChildDistances(parentNames, parentLocations, childNames, childLocations):
+    '''Distance from every parent to its closest child with another name, sorted ascending'''
+    distances = []
+    if len(childLocations) > 0:
+        tree = buildKDTree(childLocations)
+        for parentName, parentLocation in zip(parentNames, parentLocations):
+            # The closest entry can be the parent itself if the prefixes overlap
+            for (_, index, dist) in tree.find_n(parentLocation, 2):
+                if childNames[index] != parentName:
+                    distances.append(dist)
+                    break
+
+    return np.sort(np.array(distances, dtype=np.float64))
+
+def countInRange(sortedDistances, distanceThreshold : float) -> int:
+    '''Count of sorted distances which are smaller or equal to the threshold'''
+    return int(np.searchsorted(sortedDistances, distanceThreshold, side="right"))
+
+###################################
+# Select Bones Randomly           #
+###################################
+
+def closestOtherDistances(locations):
+    '''Distance from every location to the closest other location (inf if there is none)'''
+    distances = np.full(len(locations), np.inf)
+    if len(locations) > 1:
+        tree = buildKDTree(locations)
+        for index, location in enumerate(locations):
+            # The closest entry is usually the location itself
+            for (_, other, dist) in tree.find_n(location, 2):
+                if other != index:
+                    distances[index] = dist
+                    break
+
+    return distances
+
+def selectSpacedIndices(locations, count : int, minimalDistance : float, rng = random):
+    '''Dart throwing over the locations in random order, every location is tried exactly once.
+    Returns up to count indices whose locations are at least minimalDistance apart'''
+    order = list(range(len(locations)))
+    rng.shuffle(order)
+
+    if minimalDistance <= 0:
+        return order[:count]
+
+    selected = []
+    grid = SpatialHashGrid(minimalDistance)
+    for index in order:
+        if len(selected) == count:
+            break
+        if not grid.hasLocationWithin(locations[index], minimalDistance):
+            grid.insert(locations[index])
+            selected.append(index)
+
+    return selected
+
+###################################
+# Rename Bones                    #
+###################################
+
+# Blender stores bone names in 64 bytes including the terminating zero
+MAX_BONE_NAME_BYTES = 63
+
+def renameDigitSize(count : int, startNumber : int, stepSize : int, largestDigitSize : int = 0) -> int:
+    '''The digit count numbers are padded to, 0 detects it from the largest number'''
+    if largestDigitSize > 0:
+        return largestDigitSize
+
+    return len(str(max(count - 1, 0) * stepSize + startNumber))
+
+# %0<n>i, a capture %1-%9 or a single character token
+RENAME_TOKEN = re.compile(r"%(?:0(\d+)i|([1-9])|(.))")
+
+# Bones closer to the X = 0 plane are in the center
+SIDE_TOLERANCE = 1e-6
+
+def parseRenameTemplate(preset : str):
+    '''Splits the preset into literal strings and (token, argument) tuples'''
+    parts = []
+    position = 0
+    for match in RENAME_TOKEN.finditer(preset):
+        if match.start() > position:
+            parts.append(preset[position:match.start()])
+        if match.group(1) != None:
+            parts.append(("i", int(match.group(1))))
+        elif match.group(2) != None:
+            parts.append(("capture", int(match.group(2))))
+        elif match.group(3) in "ispSm%":
+            parts.append((match.group(3), None))
+        else:
+            # Unknown tokens stay in the name
+            parts.append(match.group(0))
+        position = match.end()
+    if position < len(preset):
+        parts.append(preset[position:])
+
+    return parts
+
+def templateUses(preset : str, token : str) -> bool:
+    return any(isinstance(part, tuple) and part[0] == token for part in parseRenameTemplate(preset))
+
+def compileRenameTemplate(preset : str, startNumber : int, stepSize : int, digitSize : int, matchPattern : str = ""):
+    '''Parses the preset once and returns formatter(i, oldName, parentName, x, meshName) for the bone at index i.
+    Tokens: %s old name, %i number (padded to digitSize), %0<n>i number padded to n digits, %p parent name,
+    %S side (L, R or C by the sign of x), %m name of the closest mesh, %1-%9 groups of matchPattern
+    found in the old name and %% for a single %. Raises re.error for an invalid matchPattern'''
+    parts = parseRenameTemplate(preset)
+    usesCaptures = any(isinstance(part, tuple) and part[0] == "capture" for part in parts)
+    matcher = re.compile(matchPattern) if usesCaptures and matchPattern else None
+
+    def capture(match, group : int) -> str:
+        if match == None or group > len(match.groups()):
+            return ""
+        return match.group(group) or ""
+
+    def side(x : float) -> str:
+        if x > SIDE_TOLERANCE:
+            return "L"
+        if x < -SIDE_TOLERANCE:
+            return "R"
+        return "C"
+
+    # Every piece turns (number, oldName, parentName, x, meshName, match) into a string
+    pieces = []
+    for part in parts:
+        if isinstance(part, str):
+            pieces.append(lambda number, oldName, parentName, x, meshName, match, text=part: text)
+            continue
+
+        token, argument = part
+        if token == "i":
+            width = digitSize if argument == None else argument
+            pieces.append(lambda number, oldName, parentName, x, meshName, match, width=width: str(number).zfill(width))
+        elif token == "s":
+            pieces.append(lambda number, oldName, parentName, x, meshName, match: oldName)
+        elif token == "p":
+            pieces.append(lambda number, oldName, parentName, x, meshName, match: parentName)
+        elif token == "S":
+            pieces.append(lambda number, oldName, parentName, x, meshName, match: side(x))
+        elif token == "m":
+            pieces.append(lambda number, oldName, parentName, x, meshName, match: meshName)
+        elif token == "capture":
+            pieces.append(lambda number, oldName, parentName, x, meshName, match, group=argument: capture(match, group))
+        else:
+            pieces.append(lambda number, oldName, parentName, x, meshName, match: "%")
+
+    def formatter(i : int, oldName : str, parentName : str = "", x : float = 0.0, meshName : str = "") -> str:
+        number = startNumber + i * stepSize
+        match = matcher.search(oldName) if matcher != None else None
+        return "".join(piece(number, oldName, parentName, x, meshName, match) for piece in pieces)
+
+    return formatter
+
+def formatBoneNames(preset : str, oldNames, startNumber : int, stepSize : int, fillUpZeros : bool, largestDigitSize : int = 0,
+                    parentNames = None, xLocations = None, meshNames = None, matchPattern : str = ""):
+    '''The new name of every bone, the optional lists are only needed if the preset uses their tokens'''
+    digitSize = renameDigitSize(len(oldNames), startNumber, stepSize, largestDigitSize) if fillUpZeros else 0
+    formatter = compileRenameTemplate(preset, startNumber, stepSize, digitSize, matchPattern)
+
+    count = len(oldNames)
+    parentNames = parentNames if parentNames != None else [""] * count
+    xLocations = xLocations if xLocations != None else [0.0] * count
+    meshNames = meshNames if meshNames != None else [""] * count
+
+    return [formatter(i, oldNames[i], parentNames[i], xLocations[i], meshNames[i]) for i in range(count)]
+
+def limitBoneName(name : str) -> str:
+    '''Cuts the name like Blender does when it is too long'''
+    encoded = name.encode("utf-8")
+    if len(encoded) <= MAX_BONE_NAME_BYTES:
+        return name
+
+    return encoded[:MAX_BONE_NAME_BYTES].decode("utf-8", errors="ignore")
+
+# Numeric suffix Blender adds to make a name unique
+NUMBER_SUFFIX = re.compile(r"^(.*)\.(\d+)$")
+
+def uniqueBoneNames(newNames, takenNames):
+    '''Resolves collisions with the taken names and between the new names the way Blender does
+    (Name.001, Name.002, ..., an existing number suffix is replaced). The next free number of every
+    base name is remembered, so equal names cost one set lookup each instead of a scan from .001'''
+    usedNames = set(takenNames)
+    nextNumbers = {}
+    uniqueNames = []
+    for name in newNames:
+        name = limitBoneName(name)
+        if name in usedNames:
+            match = NUMBER_SUFFIX.match(name)
+            base = match.group(1) if match != None else name
+            number = nextNumbers.get(base, 1)
+            while True:
+                suffix = "." + str(number).zfill(3)
+                candidate = limitBoneName(base[:MAX_BONE_NAME_BYTES - len(suffix)]) + suffix
+                if candidate not in usedNames:
+                    break
+                number += 1
+            nextNumbers[base] = number + 1
+            name = candidate
+        usedNames.add(name)
+        uniqueNames.append(name)
+
+    return uniqueNames
+
+###################################
+# Rename by Weight                #
+###################################
+
+def weightedCounts(weights, count : int):
+    '''Splits count by the weights with largest remainder rounding, the counts always sum up to count.
+    Ties go to the earlier weight, without any weight the count is split evenly'''
+    weights = np.maximum(np.asarray(weights, dtype=np.float64), 0)
+    if weights.sum() <= 0:
+        weights = np.ones(len(weights))
+
+    quotas = weights / weights.sum() * count
+    counts = np.floor(quotas).astype(np.int64)
+    # The stable sort keeps the list order for equal remainders
+    largestRemainders = np.argsort(-(quotas - counts), kind="stable")
+    counts[largestRemainders[:count - counts.sum()]] += 1
+    return counts
+
+def assignWeightedNames(names, weights, count : int, seed : int = None):
+    '''Picks a name for each of count items. Every name is used exactly as often as its share of
+    the weights allows and the order is shuffled, the same seed gives the same assignment'''
+    if count <= 0 or len(names) == 0:
+        return []
+
+    counts = weightedCounts(weights, count)
+    assigned = np.repeat(np.arange(len(names)), counts)
+    np.random.default_rng(seed).shuffle(assigned)
+
+    return [names[index] for index in assigned.tolist()]
+
+###################################
+# Rotate Bones                    #
+###################################
+
+def findClosestNormals(locations, sources):
+    '''For every location the normal of the closest vertex over all sources.
+    sources is a list of (tree, normals) tuples, returns None for a location if all sources are empty'''
+    closestNormals = []
+    for location in locations:
+        closestNormal = None
+        closestDistance = np.inf
+        for tree, normals in sources:
+            _, index, dist = tree.find(location)
+            if index != None and dist < closestDistance:
+                closestDistance = dist
+                closestNormal = normals[index]
+        closestNormals.append(closestNormal)
+
+    return closestNormals
+
+def barycentricWeights(point, a, b, c):
+    '''Weights of the triangle corners for a point on the triangle, sums up to 1'''
+    v0, v1, v2 = b - a, c - a, point - a
+    d00, d01, d11 = np.dot(v0, v0), np.dot(v0, v1), np.dot(v1, v1)
+    d20, d21 = np.dot(v2, v0), np.dot(v2, v1)
+    denominator = d00 * d11 - d01 * d01
+    # Degenerated triangles have no area, every corner counts the same
+    if abs(denominator) < 1e-12:
+        return np.full(3, 1 / 3)
+
+    v = (d11 * d20 - d01 * d21) / denominator
+    w = (d00 * d21 - d01 * d20) / denominator
+    return np.array((1 - v - w, v, w))
+
+def findClosestSurfaceNormals(locations, sources):
+    '''For every location the vertex normals interpolated at the closest point on the surface over all sources.
+    sources is a list of (bvhTree, coordinates, normals, triangles) tuples with a tree over the triangles,
+    returns None for a location if all sources are empty'''
+    closestNormals = []
+    for location in locations:
+        closestNormal = None
+        closestDistance = np.inf
+        for tree, coordinates, normals, triangles in sources:
+            point, faceNormal, index, dist = tree.find_nearest(location)
+            if index != None and dist < closestDistance:
+                closestDistance = dist
+                corners = triangles[index]
+                weights = barycentricWeights(np.asarray(point, dtype=np.float64), *np.asarray(coordinates[corners], dtype=np.float64))
+                normal = weights @ np.asarray(normals[corners], dtype=np.float64)
+                length = np.linalg.norm(normal)
+                # Opposing vertex normals can cancel each other out
+                closestNormal = normal / length if length > 1e-6 else np.asarray(faceNormal, dtype=np.float64)
+        closestNormals.append(closestNormal)
+
+    return closestNormals
+
+def findClosestSourceIndices(locations, trees):
+    '''For every location the index of the tree with the closest point, None if all trees are empty'''
+    closestIndices = []
+    for location in locations:
+        closestIndex = None
+        closestDistance = np.inf
+        for treeIndex, tree in enumerate(trees):
+            _, index, dist = tree.find(location)
+            if index != None and dist < closestDistance:
+                closestDistance = dist
+                closestIndex = treeIndex
+        closestIndices.append(closestIndex)
+
+    return closestIndices
+
+def eulerToMatrix(x : float, y : float, z : float):
+    '''Rotation matrix of a XYZ euler rotation'''
+    cx, sx = np.cos(x), np.sin(x)
+    cy, sy = np.cos(y), np.sin(y)
+    cz, sz = np.cos(z), np.sin(z)
+    rotX = np.array(((1, 0, 0), (0, cx, -sx), (0, sx, cx)))
+    rotY = np.array(((cy, 0, sy), (0, 1, 0), (-sy, 0, cy)))
+    rotZ = np.array(((cz, -sz, 0), (sz, cz, 0), (0, 0, 1)))
+    return rotZ @ rotY @ rotX
+
+def lookAt(target, up):
+    '''Only tested with 0,0,1 as the up vector. Other up vectors might give inaccurate results'''
+
+    d = np.array(target, dtype=np.float64)
+    d /= np.linalg.norm(d)
+    u = np.array(up, dtype=np.float64)
+    u /= np.linalg.norm(u)
+    # Modify Direction Vector
+    if up[2] == 1: d[2] *= -1
+
+    # Calculate Yaw
+    zAngle = atan2(d[1], d[0])
+    # Calculate Pitch
+    yAngle = asin(d[2])
+    # Calculate Roll
+    w0 = np.array((-d[1], d[0], 0))
+    u0 = np.cross(w0, d)
+    # Straight up or down there is no roll reference
+    xAngle = 0.0
+    if np.linalg.norm(w0) > 0:
+        xAngle = atan2(np.dot(w0, u) / np.linalg.norm(w0), np.dot(u0, u) / np.linalg.norm(u0))
+
+    return eulerToMatrix(xAngle, yAngle, zAngle)
+
+def lookAtMatrices(targets):
+    '''lookAt with 0,0,1 as the up vector for many targets at once, returns (n, 3, 3) rotation matrices'''
+    d = np.asarray(targets, dtype=np.float64).reshape(-1, 3).copy()
+    d /= np.linalg.norm(d, axis=1, keepdims=True)
+    # Modify Direction Vector
+    d[:, 2] *= -1
+
+    zAngle = np.arctan2(d[:, 1], d[:, 0])
+    yAngle = np.arcsin(np.clip(d[:, 2], -1, 1))
+    # Roll: w0 is horizontal, so only the z part of u0 is compared with the up vector
+    w0 = np.stack((-d[:, 1], d[:, 0], np.zeros(len(d))), axis=1)
+    u0 = np.cross(w0, d)
+    w0Length = np.linalg.norm(w0, axis=1)
+    u0Length = np.linalg.norm(u0, axis=1)
+    valid = w0Length > 0
+    xAngle = np.zeros(len(d))
+    xAngle[valid] = np.arctan2(w0[valid, 2] / w0Length[valid], u0[valid, 2] / u0Length[valid])
+
+    cx, sx = np.cos(xAngle), np.sin(xAngle)
+    cy, sy = np.cos(yAngle), np.sin(yAngle)
+    cz, sz = np.cos(zAngle), np.sin(zAngle)
+    # rotZ @ rotY @ rotX like eulerToMatrix
+    return np.stack((
+        np.stack((cz * cy, cz * sy * sx - sz * cx, cz * sy * cx + sz * sx), axis=1),
+        np.stack((sz * cy, sz * sy * sx + cz * cx, sz * sy * cx - cz * sx), axis=1),
+        np.stack((-sy, cy * sx, cy * cx), axis=1),
+    ), axis=1)
+
+def boneZAxes(directions):
+    '''Z axis of bones with roll 0 pointing in the unit directions, the same way Blender builds the bone matrix'''
+    x, y, z = directions[:, 0], directions[:, 1], directions[:, 2]
+    theta = 1 + y
+    # Bones pointing (almost) straight down -Y
+    closeToNegativeY = theta <= 1e-5
+    regular = ~closeToNegativeY | ((x != 0) | (z != 0)) & (theta > 1e-9)
+    theta = np.where(closeToNegativeY, (x * x + z * z) / 2, theta)
+    theta = np.where(regular, theta, 1)
+
+    axes = np.stack((-x * z / theta, -z, 1 - z * z / theta), axis=1)
+    axes[~regular] = (0, 0, 1)
+    return axes
+
+def orientBones(normals, facingAxis : str):
+    '''Direction (unit length tail - head) and roll of bones rotated like the Rotate Bones operator does it
+    bone by bone: starting from a bone along Y (X for the Y axis) with roll 0 and rotated by lookAt of the normal.
+    Returns (directions, rolls) as (n, 3) and (n,) numpy arrays'''
+    rotations = lookAtMatrices(normals)
+    start = np.array((1.0, 0.0, 0.0)) if facingAxis == "Y_AXIS" else np.array((0.0, 1.0, 0.0))
+
+    directions = rotations @ start
+    directions /= np.linalg.norm(directions, axis=1, keepdims=True)
+    # The roll keeps the rotated Z axis of the start bone
+    rotatedZ = rotations @ boneZAxes(start.reshape(1, 3))[0]
+    zAxes = boneZAxes(directions)
+    rolls = np.arctan2(np.einsum("ij,ij->i", np.cross(zAxes, rotatedZ), directions), np.einsum("ij,ij->i", zAxes, rotatedZ))
+
+    # Special Case Z Axis
+    if facingAxis == "Z_AXIS":
+        rolls += np.pi / 2
+
+    return directions, rolls
+
+###################################
+# Scale by Reference              #
+###################################
+
+def axisExtent(coordinates, axisIndex : int) -> float:
+    '''Distance between the smallest and the largest coordinate on the axis'''
+    if len(coordinates) == 0:
+        return 0.0
+
+    axisValues = np.asarray(coordinates)[:, axisIndex]
+    return float(axisValues.max() - axisValues.min())
+
+def parseTargetLengths(lines) -> list:
+    '''(target name, real length) pairs from CSV lines with two columns. The first line may be a header,
+    empty lines are skipped. Raises ValueError with the line number for any other invalid line'''
+    targetLengths = []
+    for lineNumber, row in enumerate(csv.reader(lines), 1):
+        row = [value.strip() for value in row]
+        if not any(row):
+            continue
+
+        try:
+            if len(row) < 2 or row[0] == "":
+                raise ValueError()
+            targetLengths.append((row[0], float(row[1])))
+        except ValueError:
+            if lineNumber == 1:
+                continue
+            raise ValueError("Line " + str(lineNumber) + " needs a target name and a length: " + ",".join(row))
+
+    return targetLengths
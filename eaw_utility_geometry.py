@@ -0,0 +1,348 @@
+import bpy
+
+import numpy as np
+
+from collections import OrderedDict
+
+from bpy.app.handlers import persistent
+
+from bpy.types import (Armature, EditBone, Mesh, Object)
+
+from typing import List
+
+from mathutils.bvhtree import BVHTree
+from mathutils.kdtree import KDTree
+
+from . eaw_utility_core import (buildKDTree, closestChildDistances, closestOtherDistances, countInRange, mapParallel, uniqueBoneNames)
+
+# Rough memory usage of one mathutils KDTree node (co, index and child indices)
+KDTREE_NODE_SIZE = 32
+
+def getWorldGeometry(obj : Object, mesh : Mesh = None):
+    '''Returns the world space vertex coordinates and vertex normals of a mesh object as (n, 3) numpy arrays.
+    Reads obj.data unless another mesh of the object (e.g. the evaluated one) is given'''
+    mesh = Mesh(obj.data if mesh == None else mesh)
+    count = len(mesh.vertices)
+
+    # Read all vertices at once
+    coordinates = np.empty(count * 3, dtype=np.float32)
+    normals = np.empty(count * 3, dtype=np.float32)
+    mesh.vertices.foreach_get("co", coordinates)
+    mesh.vertices.foreach_get("normal", normals)
+
+    # Transform into world space (normals use the inverse transpose and get normalized again)
+    matrix = np.array(obj.matrix_world, dtype=np.float64)
+    normalMatrix = np.array(obj.matrix_world.to_3x3().inverted_safe().transposed(), dtype=np.float64)
+    coordinates = coordinates.reshape(-1, 3) @ matrix[:3, :3].T + matrix[:3, 3]
+    normals = normals.reshape(-1, 3) @ normalMatrix.T
+    lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+    normals /= np.where(lengths > 0, lengths, 1)
+
+    return coordinates.astype(np.float32), normals.astype(np.float32)
+
+class SurfaceGeometry:
+    '''World space triangles of the evaluated mesh of an object with a BVHTree for closest point queries'''
+
+    def __init__(self, context, obj : Object):
+        evaluatedObject = obj.evaluated_get(context.evaluated_depsgraph_get())
+        mesh = evaluatedObject.to_mesh()
+        try:
+            mesh.calc_loop_triangles()
+            self.coordinates, self.normals = getWorldGeometry(obj, mesh)
+            triangles = np.empty(len(mesh.loop_triangles) * 3, dtype=np.int32)
+            mesh.loop_triangles.foreach_get("vertices", triangles)
+            self.triangles = triangles.reshape(-1, 3)
+        finally:
+            evaluatedObject.to_mesh_clear()
+
+        self.tree = BVHTree.FromPolygons(self.coordinates.tolist(), self.triangles.tolist(), all_triangles=True)
+
+    @property
+    def isEmpty(self) -> bool:
+        return len(self.triangles) == 0
+
+class MeshGeometry:
+    '''World space vertex coordinates, normals and a lazily built KDTree of one mesh object'''
+
+    def __init__(self, objectName : str, coordinates, normals, onResize = None):
+        self.objectName = objectName
+        self.coordinates = coordinates
+        self.normals = normals
+        self.onResize = onResize
+        self._tree = None
+
+    @property
+    def tree(self) -> KDTree:
+        if self._tree == None:
+            self._tree = buildKDTree(self.coordinates)
+            # The tree counts towards the memory budget of the cache
+            if self.onResize != None:
+                self.onResize()
+        return self._tree
+
+    @property
+    def size(self) -> int:
+        size = self.coordinates.nbytes + self.normals.nbytes
+        if self._tree != None:
+            size += len(self.coordinates) * KDTREE_NODE_SIZE
+        return size
+
+class GeometryCache:
+    '''Least recently used cache of MeshGeometry keyed by object and mesh name, objects sharing a mesh have their own world space data.
+    Entries are removed by the depsgraph handler when the mesh or the transform of its object changes'''
+
+    def __init__(self):
+        self.entries = OrderedDict()
+
+    def get(self, obj : Object, memoryBudget : int) -> MeshGeometry:
+        key = (obj.name, obj.data.name)
+        geometry = self.entries.get(key)
+
+        if geometry != None:
+            self.entries.move_to_end(key)
+            return geometry
+
+        coordinates, normals = getWorldGeometry(obj)
+        geometry = MeshGeometry(obj.name, coordinates, normals, lambda: self.evict(memoryBudget))
+        self.entries[key] = geometry
+        self.evict(memoryBudget)
+        return geometry
+
+    def evict(self, memoryBudget : int):
+        '''Removes the least recently used entries until the budget is met. The newest entry always stays'''
+        size = sum(geometry.size for geometry in self.entries.values())
+        while size > memoryBudget and len(self.entries) > 1:
+            _, geometry = self.entries.popitem(last=False)
+            size -= geometry.size
+
+    def invalidateObject(self, objectName : str):
+        for key in [key for key in self.entries if key[0] == objectName]:
+            del self.entries[key]
+
+    def invalidateMesh(self, meshName : str):
+        for key in [key for key in self.entries if key[1] == meshName]:
+            del self.entries[key]
+
+    def clear(self):
+        self.entries.clear()
+
+geometryCache = GeometryCache()
+
+def getCachedGeometry(context, obj : Object) -> MeshGeometry:
+    '''Returns the cached geometry of a mesh object, the memory budget is taken from the EAW Utility properties'''
+    memoryBudget = context.scene.eaw_utility.geometryCacheBudget * 1024 * 1024
+    return geometryCache.get(obj, memoryBudget)
+
+class EditBoneLookup:
+    '''Name -> EditBone map of an armature in Edit Mode. Build it once per operator run and
+    create or rename bones through it, so it stays valid without searching armature.edit_bones'''
+
+    def __init__(self, armature : Armature):
+        self.armature = armature
+        self.bones = {bone.name : bone for bone in armature.edit_bones}
+
+    def __getitem__(self, name : str) -> EditBone:
+        return self.bones[name]
+
+    def __contains__(self, name : str) -> bool:
+        return name in self.bones
+
+    def __len__(self) -> int:
+        return len(self.bones)
+
+    def get(self, name : str, default = None) -> EditBone:
+        return self.bones.get(name, default)
+
+    def values(self):
+        return self.bones.values()
+
+    def new(self, name : str) -> EditBone:
+        editBone = self.armature.edit_bones.new(name)
+        # Blender adds a number to the name if it is taken
+        self.bones[editBone.name] = editBone
+        return editBone
+
+    def rename(self, editBone : EditBone, name : str) -> str:
+        self.bones.pop(editBone.name, None)
+        editBone.name = name
+        self.bones[editBone.name] = editBone
+        return editBone.name
+
+    def renameAll(self, editBones : List[EditBone], names : List[str]) -> List[str]:
+        '''Renames the bones and returns the names they got. Collisions are resolved up front (Name.001, ...),
+        so Blender does not search the armature and add suffixes. Every rename updates vertex groups, constraints
+        and animation paths, so only bones whose new name is still held by another renamed bone go through a
+        temporary name first, which lets bones swap or shift names'''
+        renamedNames = set(editBone.name for editBone in editBones)
+        names = uniqueBoneNames(names, [name for name in self.bones if name not in renamedNames])
+        takenNames = set(names)
+
+        delayed = []
+        for i, (editBone, name) in enumerate(zip(editBones, names)):
+            if editBone.name == name:
+                continue
+            if name not in renamedNames:
+                self.rename(editBone, name)
+                continue
+
+            temporaryName = "~eawu_" + str(i)
+            while temporaryName in self.bones or temporaryName in takenNames:
+                temporaryName = "~" + temporaryName
+            self.rename(editBone, temporaryName)
+            delayed.append((editBone, name))
+
+        for editBone, name in delayed:
+            self.rename(editBone, name)
+
+        return names
+
+class ArmatureCache:
+    '''Data derived from the bones of an armature, keyed by armature name and a key describing the inputs (e.g. the prefixes).
+    All entries of an armature are removed by the depsgraph handler when the armature changes'''
+
+    def __init__(self):
+        self.entries = {}
+
+    def get(self, armature : Armature, key : tuple, build):
+        armatureEntries = self.entries.setdefault(armature.name, {})
+        if key not in armatureEntries:
+            armatureEntries[key] = build(armature)
+        return armatureEntries[key]
+
+    def contains(self, armature : Armature, key : tuple) -> bool:
+        return key in self.entries.get(armature.name, {})
+
+    def invalidate(self, armatureName : str):
+        self.entries.pop(armatureName, None)
+
+    def clear(self):
+        self.entries.clear()
+
+armatureCache = ArmatureCache()
+
+def getArmatureObjects(context, armatureScope : str) -> List[Object]:
+    '''The armature objects an operation should work on: the active one, the selected ones or all in the scene'''
+    if armatureScope == "ALL":
+        return [obj for obj in context.scene.objects if obj.type == "ARMATURE"]
+    if armatureScope == "SELECTED":
+        return [obj for obj in context.selected_objects if obj.type == "ARMATURE"]
+
+    obj = context.object
+    return [obj] if obj is not None and obj.type == "ARMATURE" else []
+
+def getParentCandidates(editBones : EditBoneLookup, parentBonesPrefix : str, childBonesPrefix : str):
+    '''Names and armature space heads of the possible parents and the unparented children of an armature in Edit Mode as
+    (parentNames, parentLocations, childNames, childLocations), the locations are (n, 3) numpy arrays'''
+    parents = [bone for bone in editBones.values() if bone.name.startswith(parentBonesPrefix)]
+    children = [bone for bone in editBones.values() if bone.name.startswith(childBonesPrefix) and bone.parent == None]
+
+    return ([bone.name for bone in parents],
+            np.array([bone.head for bone in parents], dtype=np.float64).reshape(-1, 3),
+            [bone.name for bone in children],
+            np.array([bone.head for bone in children], dtype=np.float64).reshape(-1, 3))
+
+class ChildrenCoverage:
+    '''The distance from every parent to its closest unparented child, sorted so
+    the count of parents with a child in range is a binary search'''
+
+    def __init__(self, armature : Armature, parentBonesPrefix : str, childBonesPrefix : str, containerBoneSufix : str):
+        # Only reads the bones, the distances are computed by compute() which does not touch bpy
+        self.armatureName = armature.name
+        self.children = 0
+        self.childrenWithParent = 0
+        childNames = []
+        childLocations = []
+        for bone in armature.bones:
+            if bone.name.startswith(childBonesPrefix):
+                self.children += 1
+                if bone.parent != None:
+                    self.childrenWithParent += 1
+                else:
+                    childNames.append(bone.name)
+                    childLocations.append(bone.head_local)
+
+        parents = [bone for bone in armature.bones if bone.name.startswith(parentBonesPrefix) and not bone.name.endswith(containerBoneSufix)]
+        self.candidates = ([bone.name for bone in parents],
+                           np.array([bone.head_local for bone in parents], dtype=np.float64).reshape(-1, 3),
+                           childNames,
+                           np.array(childLocations, dtype=np.float64).reshape(-1, 3))
+        self.sortedDistances = None
+
+    def compute(self):
+        self.sortedDistances = closestChildDistances(*self.candidates)
+        self.candidates = None
+        return self
+
+    @property
+    def childrenWithoutParent(self) -> int:
+        return self.children - self.childrenWithParent
+
+    def countInRange(self, distanceThreshold : float) -> int:
+        '''Count of parents which have an unparented child within the distance threshold'''
+        return countInRange(self.sortedDistances, distanceThreshold)
+
+def hasChildrenCoverages(armatures : List[Armature], parentBonesPrefix : str, childBonesPrefix : str, containerBoneSufix : str) -> bool:
+    '''True if getChildrenCoverages can answer from the cache without reading any bones'''
+    key = ("coverage", parentBonesPrefix, childBonesPrefix, containerBoneSufix)
+    return all(armatureCache.contains(armature, key) for armature in armatures)
+
+def getChildrenCoverages(armatures : List[Armature], parentBonesPrefix : str, childBonesPrefix : str, containerBoneSufix : str) -> List[ChildrenCoverage]:
+    '''The coverage of every armature. Missing entries read their bones one after another
+    and then compute the distances in parallel'''
+    key = ("coverage", parentBonesPrefix, childBonesPrefix, containerBoneSufix)
+    missing = [ChildrenCoverage(armature, parentBonesPrefix, childBonesPrefix, containerBoneSufix)
+               for armature in armatures if not armatureCache.contains(armature, key)]
+    computed = {coverage.armatureName : coverage for coverage in mapParallel(ChildrenCoverage.compute, missing)}
+
+    return [armatureCache.get(armature, key, lambda armature: computed[armature.name]) for armature in armatures]
+
+def hasClosestBoneDistances(armature : Armature) -> bool:
+    return armatureCache.contains(armature, ("closestBones",))
+
+def getClosestBoneDistances(armature : Armature):
+    '''Distance from every bone head to the closest other bone head, in the order of armature.bones'''
+    def build(armature):
+        return closestOtherDistances([bone.head_local for bone in armature.bones])
+
+    return armatureCache.get(armature, ("closestBones",), build)
+
+def getBoneHeads(armature : Armature):
+    '''Armature space head locations of all bones as (n, 3) numpy array, in the order of armature.bones'''
+    def build(armature):
+        heads = np.empty(len(armature.bones) * 3, dtype=np.float32)
+        armature.bones.foreach_get("head_local", heads)
+        return heads.reshape(-1, 3)
+
+    return armatureCache.get(armature, ("boneHeads",), build)
+
+def hasPreviewParentLocations(armature : Armature, parentBonesPrefix : str, childBonesPrefix : str) -> bool:
+    return armatureCache.contains(armature, ("previewParents", parentBonesPrefix, childBonesPrefix))
+
+def getPreviewParentLocations(armature : Armature, parentBonesPrefix : str, childBonesPrefix : str):
+    '''Armature space head locations of all unparented parent bones as (n, 3) numpy array'''
+    def build(armature):
+        locations = [bone.head_local for bone in armature.bones
+                     if bone.name.startswith(parentBonesPrefix) and not bone.name.startswith(childBonesPrefix) and bone.parent == None]
+        return np.array(locations, dtype=np.float32).reshape(-1, 3)
+
+    return armatureCache.get(armature, ("previewParents", parentBonesPrefix, childBonesPrefix), build)
+
+@persistent
+def onDepsgraphUpdate(scene, depsgraph):
+    for update in depsgraph.updates:
+        data = update.id
+        # Bones, parenting or names of an armature changed
+        if isinstance(data, Armature):
+            armatureCache.invalidate(data.name)
+        # Transform changes of the object or geometry changes of the mesh make the world space data invalid
+        elif isinstance(data, Object) and data.type == "MESH" and (update.is_updated_transform or update.is_updated_geometry):
+            geometryCache.invalidateObject(data.name)
+            if update.is_updated_geometry:
+                geometryCache.invalidateMesh(data.data.name)
+        elif isinstance(data, Mesh) and update.is_updated_geometry:
+            geometryCache.invalidateMesh(data.name)
+
+@persistent
+def onLoadPost(*args):
+    geometryCache.clear()
+    armatureCache.clear()
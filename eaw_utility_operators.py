@@ -2,15 +2,499 @@ import bpy
 
 import random
 
+import re
+
+import inspect
+
 import sys
 
+import time
+
+import numpy as np
+
+from concurrent.futures import wait
+
 from bpy.types import (Operator, Armature, Bone, EditBone, MeshVertex, Mesh)
 
+from bpy.props import StringProperty
+
+from bpy_extras.io_utils import ExportHelper
+
 from mathutils import (Vector, Matrix, Quaternion, Euler)
 from math import radians
 
 from . eaw_utility_properties import EAWU_Properties
 from .eaw_utility_util import *
+from .eaw_utility_profiling import (ProfileRecord, profiler)
+from .eaw_utility_geometry import (EditBoneLookup, SurfaceGeometry, getArmatureObjects, getParentCandidates)
+from .eaw_utility_core import (assignWeightedNames, findClosestNormals, findClosestSurfaceNormals, findParentMatches, formatBoneNames, orientBones, parseTargetLengths, selectSpacedIndices, startParallel)
+
+# Bones or matches processed between two progress updates
+STEP_CHUNK_SIZE = 256
+
+###############################################################
+# Edit Mode Steps:                                            #
+# The work of the operators, shared with the pipeline. They   #
+# expect the armature to be in EDIT mode and editBones to be  #
+# its EditBoneLookup                                          #
+###############################################################
+def applyParentMatches(properties : EAWU_Properties, editBones : EditBoneLookup, parentNames : list, childNames : list, matches : list):
+    '''Parents the matched children and returns the names of the created container bones'''
+    # Get Properties
+    shouldAddContainerBone = properties.shouldAddContainerBone
+    containerBoneSufix = properties.containerBoneSufix
+
+    containerNames = []
+    for parentIndex, childIndex in matches:
+        parent = editBones[parentNames[parentIndex]]
+        child = editBones[childNames[childIndex]]
+
+        if shouldAddContainerBone:
+            # Add Container Bone
+            editBone = editBones.new(parent.name + containerBoneSufix)
+            editBone.tail = parent.tail
+            editBone.head = parent.head
+            editBone.parent = parent
+            containerNames.append(editBone.name)
+            # Adjust the Parent for the child
+            parent = editBone
+
+        # Set the correct parent for the child
+        child.parent = parent
+
+    return containerNames
+
+def parentBones(properties : EAWU_Properties, armatureObjects : list):
+    '''Parents the bones of every armature and returns the count per armature'''
+    return runSteps(parentBoneSteps(properties, armatureObjects, []))
+
+def selectBonesRandomly(properties : EAWU_Properties, editBones : EditBoneLookup):
+    # Get Properties
+    randomBoneCount = properties.randomBoneCount
+    spaceBonesByDistance = properties.spaceBonesByDistance
+    minimalBoneDistance = properties.minimalBoneDistance
+
+    bones = list(editBones.values())
+    profiler.count("bones", len(bones))
+    for editBone in bones:
+        editBone.select = False
+        editBone.select_head = False
+        editBone.select_tail = False
+
+    # Spaced selection through a spatial hash grid, every bone is tried only once
+    locations = [Vector(bone.head) for bone in bones]
+    selectedIndecies = selectSpacedIndices(locations, randomBoneCount, minimalBoneDistance if spaceBonesByDistance else 0)
+
+    for index in selectedIndecies:
+        editBone = bones[index]
+        editBone.select = True
+        editBone.select_head = True
+        editBone.select_tail = True
+
+    return len(selectedIndecies)
+
+def renameBones(context, properties : EAWU_Properties, selectedBones : list, editBones : EditBoneLookup):
+    # The preset is compiled once and all names are formatted in one pass
+    preset = properties.renameBonePreset
+    oldNames = [bone.name for bone in selectedBones]
+    profiler.count("bones", len(oldNames))
+    parentNames, xLocations, meshNames = getRenameInputs(context, selectedBones, preset)
+    newNames = formatBoneNames(preset, oldNames, properties.renameStartNumber, properties.renameStepSizeNumber,
+                               properties.fillUpZeros, properties.largestDigitSize,
+                               parentNames, xLocations, meshNames, properties.renameMatchPattern)
+
+    # Collisions are resolved in python, Blender does not need to search the armature for every bone
+    editBones.renameAll(selectedBones, newNames)
+
+def renameBonesByWeight(properties : EAWU_Properties, selectedBones : list, editBones : EditBoneLookup):
+    # Copy important Values
+    weightList = properties.renameWeightList
+    weights = [item.weight for item in weightList]
+    names = [item.value for item in weightList]
+    newNames = assignWeightedNames(names, weights, len(selectedBones), properties.renameSeed)
+    profiler.count("bones", len(newNames))
+
+    # Equal names get their .001 suffixes up front
+    editBones.renameAll(selectedBones, newNames)
+
+    for bone, newName in zip(selectedBones, newNames):
+        if properties.shouldChangeAlamoProperties:
+            # Update Alamo Bone Properties (Changing mode not required, because we are already in it)
+            try:
+                bone.EnableProxy = True
+                bone.ProxyName = newName
+            except:
+                print("The Alamo Object Import plugin is not installed")
+
+def rotateBoneSteps(context, properties : EAWU_Properties, selectedBones : list, chunkSize : int = STEP_CHUNK_SIZE):
+    '''Generator rotating the bones chunk by chunk, yields (done, total) after every chunk.
+    Returns False if there is no source mesh'''
+    scene = context.scene
+
+    # Get Properties
+    rotatingMehtod = properties.rotatingMethod
+    useNormalMesh = properties.useNormalObject
+    normalMeshName = properties.normalObject
+    facingAxis = properties.facingAxis
+
+    if rotatingMehtod == "NORMAL_DIRECTION" or rotatingMehtod == "SURFACE_NORMAL":
+        # Collect the source meshes
+        sourceObjects = []
+        # Use custom Normal Mesh
+        if useNormalMesh:
+            # Find correct Mesh
+            outer = None
+            for obj in scene.objects:
+                if obj.type == "MESH" and obj.data.name == normalMeshName:
+                    outer = obj
+            # Stop if outer is None
+            if outer == None: return False
+            sourceObjects.append(outer)
+        # Use all meshes as Normal Mesh
+        else:
+            sourceObjects = [outer for outer in scene.objects if outer.type == "MESH"]
+
+        if rotatingMehtod == "NORMAL_DIRECTION":
+            # Vertices, normals and the KDTree of every mesh are cached between runs
+            geometry = [getCachedGeometry(context, outer) for outer in sourceObjects]
+            geometry = [meshGeometry for meshGeometry in geometry if len(meshGeometry.coordinates) > 0]
+            if not geometry: return False
+            sources = [(meshGeometry.tree, meshGeometry.normals) for meshGeometry in geometry]
+            profiler.count("vertices", sum(len(meshGeometry.coordinates) for meshGeometry in geometry))
+            findNormals = lambda locations: findClosestNormals(locations, sources)
+        else:
+            # The BVHTrees of the evaluated meshes are built once per run and used for all bones
+            surfaces = [SurfaceGeometry(context, outer) for outer in sourceObjects]
+            surfaces = [surface for surface in surfaces if not surface.isEmpty]
+            if not surfaces: return False
+            sources = [(surface.tree, surface.coordinates, surface.normals, surface.triangles) for surface in surfaces]
+            profiler.count("triangles", sum(len(surface.triangles) for surface in surfaces))
+            findNormals = lambda locations: findClosestSurfaceNormals(locations, sources)
+        # In multi-object Edit Mode the selection can hold bones of several armatures,
+        # every armature is read and written with its own edit bones and matrix
+        armatureObjects = {}
+        for obj in [context.object] + list(scene.objects):
+            if obj is not None and obj.type == "ARMATURE" and obj.mode == "EDIT":
+                armatureObjects.setdefault(obj.data.name, obj)
+        boneGroups = {}
+        for bone in selectedBones:
+            boneGroups.setdefault(bone.id_data.name, []).append(bone)
+
+        done = 0
+        for armatureName, bones in boneGroups.items():
+            armatureObject = armatureObjects.get(armatureName)
+            if armatureObject == None:
+                continue
+            armature = Armature(armatureObject.data)
+            matrix = np.array(armatureObject.matrix_world, dtype=np.float64)
+
+            # Read all heads at once, bones without a normal keep their orientation
+            indices = getEditBoneIndices(armature, bones)
+            heads = readEditBoneArray(armature, "head", 3)[indices]
+            worldHeads = heads @ matrix[:3, :3].T + matrix[:3, 3]
+            normals = np.zeros((len(bones), 3))
+            hasNormal = np.zeros(len(bones), dtype=bool)
+
+            for start in range(0, len(bones), chunkSize):
+                # Get the normal of the closest vertex or surface point for every bone (the meshes are in world space)
+                closestNormals = findNormals(worldHeads[start:start + chunkSize])
+                for i, closestNormal in enumerate(closestNormals, start):
+                    if closestNormal is not None:
+                        normals[i] = closestNormal
+                        hasNormal[i] = True
+
+                done += min(chunkSize, len(bones) - start)
+                context = yield (done, len(selectedBones))
+
+            # The normals are in world space, the tails and rolls are written in armature space
+            localNormals = normals[hasNormal] @ np.linalg.inv(matrix[:3, :3]).T
+            lengths = np.linalg.norm(localNormals, axis=1, keepdims=True)
+            localNormals = localNormals / np.where(lengths > 0, lengths, 1)
+
+            # Orient all bones at once and write tail and roll back with one call each
+            directions, rolls = orientBones(localNormals, facingAxis)
+            tails = readEditBoneArray(armature, "tail", 3)
+            allRolls = readEditBoneArray(armature, "roll")
+            tails[indices[hasNormal]] = heads[hasNormal] + directions
+            allRolls[indices[hasNormal]] = rolls
+            writeEditBoneArray(armature, "tail", tails)
+            writeEditBoneArray(armature, "roll", allRolls)
+
+    return True
+
+def rotateBones(context, properties : EAWU_Properties, selectedBones : list):
+    '''Returns False if there is no source mesh'''
+    return runSteps(rotateBoneSteps(context, properties, selectedBones), context)
+
+def enterArmatureEditMode(context, armatureObjects : list):
+    '''Enters Edit Mode once for all armatures (multi-object editing), the first one becomes active.
+    Nothing is switched if they are already in Edit Mode with the first one active.
+    Returns the previously active and selected objects and whether the mode was switched for leaveArmatureEditMode'''
+    viewLayer = context.view_layer
+    activeObject = viewLayer.objects.active
+
+    # Every mode switch rebuilds the edit bones, usually the pipeline is started in Edit Mode of its only armature
+    if activeObject == armatureObjects[0] and all(obj.mode == "EDIT" for obj in armatureObjects):
+        return (activeObject, None, False)
+
+    previous = (activeObject, list(context.selected_objects), True)
+
+    # Edit Mode is only entered for the objects selected when switching to it
+    if activeObject is not None and activeObject.mode != "OBJECT":
+        bpy.ops.object.mode_set(mode='OBJECT', toggle=False)
+    for obj in previous[1]:
+        obj.select_set(False)
+    for obj in armatureObjects:
+        obj.select_set(True)
+    viewLayer.objects.active = armatureObjects[0]
+    bpy.ops.object.mode_set(mode='EDIT', toggle=False)
+
+    return previous
+
+def leaveArmatureEditMode(context, previous : tuple, mode : str = "OBJECT"):
+    '''Writes the edit bones back and restores the active and selected objects'''
+    viewLayer = context.view_layer
+    activeObject, selectedObjects, switched = previous
+
+    # Edit Mode was not switched on enter, stay in it if that is the mode to return to
+    if not switched:
+        if mode != "EDIT":
+            bpy.ops.object.mode_set(mode=mode, toggle=False)
+        return
+
+    bpy.ops.object.mode_set(mode='OBJECT', toggle=False)
+    for obj in context.selected_objects:
+        obj.select_set(False)
+    for obj in selectedObjects:
+        obj.select_set(True)
+    viewLayer.objects.active = activeObject
+
+    if mode != "OBJECT" and activeObject is not None:
+        bpy.ops.object.mode_set(mode=mode, toggle=False)
+
+def parentBoneSteps(properties : EAWU_Properties, armatureObjects : list, changes : list, chunkSize : int = STEP_CHUNK_SIZE):
+    '''Generator parenting the bones of every armature, yields (done parents, total parents) after every step.
+    All armatures have to be in Edit Mode (enterArmatureEditMode). Every edited armature gets an entry in changes
+    so the edits can be undone, returns the count per armature'''
+    # Get Properties
+    parentBonesPrefix = properties.parentBonesPrefix
+    childBonesPrefix = properties.childBonesPrefix
+    distanceThreshold = properties.distanceThreshold
+
+    # Counting the parents by name is cheap, reading the bones and matching happens in the steps
+    allEditBones = [EditBoneLookup(Armature(obj.data)) for obj in armatureObjects]
+    total = sum(sum(1 for name in editBones.bones if name.startswith(parentBonesPrefix)) for editBones in allEditBones)
+    profiler.count("armatures", len(armatureObjects))
+    done = 0
+    yield (done, total)
+
+    # Read the bones one armature after another, one step each
+    candidates = []
+    for editBones in allEditBones:
+        candidates.append(getParentCandidates(editBones, parentBonesPrefix, childBonesPrefix))
+        profiler.count("bones", len(candidates[-1][0]) + len(candidates[-1][2]))
+        yield (done, total)
+
+    # The read-only matching of all armatures runs on a thread pool, the steps apply the finished matches in chunks meanwhile
+    executor, futures = startParallel(lambda candidate: findParentMatches(*candidate, distanceThreshold), candidates)
+    try:
+        results = []
+        for obj, editBones, candidate, future in zip(armatureObjects, allEditBones, candidates, futures):
+            parentNames, _, childNames, _ = candidate
+            # Wait in short intervals, so a modal operator still gets its events
+            while not wait([future], timeout=0.01).done:
+                yield (done, total)
+            matches = future.result()
+
+            change = {"object" : obj, "containers" : [], "children" : []}
+            changes.append(change)
+
+            for start in range(0, len(matches), chunkSize):
+                chunk = matches[start:start + chunkSize]
+                change["containers"].extend(applyParentMatches(properties, editBones, parentNames, childNames, chunk))
+                change["children"].extend(childNames[childIndex] for (_, childIndex) in chunk)
+                # The matches are ordered by parent
+                yield (done + chunk[-1][0] + 1, total)
+
+            done += len(parentNames)
+            profiler.count("matches", len(matches))
+            results.append(obj.name + ": " + str(len(matches)))
+    finally:
+        executor.shutdown(wait=False)
+
+    return results
+
+def revertParentChanges(changes : list):
+    '''Removes the container bones and parents recorded by parentBoneSteps, the armatures have to be in Edit Mode'''
+    for change in reversed(changes):
+        armature = Armature(change["object"].data)
+        editBones = EditBoneLookup(armature)
+
+        for childName in change["children"]:
+            child = editBones.get(childName)
+            if child != None:
+                child.parent = None
+        for containerName in change["containers"]:
+            container = editBones.get(containerName)
+            if container != None:
+                armature.edit_bones.remove(container)
+
+    changes.clear()
+
+def scaleByReferenceSteps(operator, context, properties : EAWU_Properties, previousScales : dict):
+    '''Generator measuring the reference, then the target and scaling the target, yields (done, 3) after every step.
+    The scales before the change are stored in previousScales, returns an error message or None'''
+    if properties.scaleTargetSource != "SINGLE":
+        return (yield from batchScaleByReferenceSteps(operator, context, properties, previousScales))
+
+    # Get Properties
+    refMesh = properties.refModel
+    refLength = properties.refModelLength
+    targetMesh = properties.targetModel
+    targetLength = properties.targetModelLength
+    axis = properties.lengthAxis
+    useBoundingBox = properties.useBoundingBoxLength
+
+    # Calculate required values
+    scaleRatio = targetLength / refLength
+    refBlenderLength = getModelLength(operator, context, refMesh, axis, useBoundingBox)
+    context = yield (1, 3)
+    targetBlenderLength = getModelLength(operator, context, targetMesh, axis, useBoundingBox)
+    context = yield (2, 3)
+
+    if refBlenderLength == 0 or targetBlenderLength == 0:
+        return "The reference and the target model need a length on the chosen axis"
+
+    # Scale target
+    newScale = (refBlenderLength / targetBlenderLength) * scaleRatio
+    for obj in context.scene.objects:
+        if obj.type == "MESH" and obj.data.name == targetMesh:
+            previousScales[obj.name] = tuple(obj.scale)
+            obj.scale.x = newScale
+            obj.scale.y = newScale
+            obj.scale.z = newScale
+    yield (3, 3)
+
+    return None
+
+def getScaleTargets(context, properties : EAWU_Properties):
+    '''The target mesh objects, their real lengths and the target names which were not found'''
+    if properties.scaleTargetSource == "COLLECTION":
+        collection = bpy.data.collections.get(properties.targetCollection)
+        if collection == None:
+            return [], [], [properties.targetCollection]
+
+        objects = [obj for obj in collection.all_objects if obj.type == "MESH"]
+        lengths = []
+        for obj in objects:
+            length = obj.get(properties.targetLengthProperty)
+            lengths.append(float(length) if isinstance(length, (int, float)) else properties.targetModelLength)
+        return objects, lengths, []
+
+    with open(bpy.path.abspath(properties.targetCSVPath), newline="") as file:
+        targetLengths = parseTargetLengths(file)
+
+    # Targets are object names or mesh names like the single target, the scene is searched only once
+    objectsByName = {}
+    objectsByMesh = {}
+    for obj in context.scene.objects:
+        if obj.type == "MESH":
+            objectsByName[obj.name] = [obj]
+            objectsByMesh.setdefault(obj.data.name, []).append(obj)
+
+    objects = []
+    lengths = []
+    missing = []
+    for name, length in targetLengths:
+        targets = objectsByName.get(name, objectsByMesh.get(name))
+        if targets == None:
+            missing.append(name)
+            continue
+        objects += targets
+        lengths += [length] * len(targets)
+
+    return objects, lengths, missing
+
+def batchScaleByReferenceSteps(operator, context, properties : EAWU_Properties, previousScales : dict):
+    '''Generator measuring the reference once, then all targets and scaling them in one pass, yields (done, 3) after every step.
+    The scales before the change are stored in previousScales, returns an error message or None'''
+    # Get Properties
+    refMesh = properties.refModel
+    refLength = properties.refModelLength
+    axis = properties.lengthAxis
+    useBoundingBox = properties.useBoundingBoxLength
+
+    try:
+        targets, targetLengths, missing = getScaleTargets(context, properties)
+    except (OSError, ValueError) as error:
+        return "The targets could not be read: " + str(error)
+
+    if missing:
+        operator.report({"WARNING"}, "Targets not found: " + ", ".join(missing))
+    if not targets:
+        return "No target models found"
+
+    # Calculate required values, the target extents are computed in parallel from the cached vertex arrays
+    refBlenderLength = getModelLength(operator, context, refMesh, axis, useBoundingBox)
+    context = yield (1, 3)
+    targetBlenderLengths = np.array(getModelLengths(context, targets, axis, useBoundingBox), dtype=np.float64)
+    profiler.count("targets", len(targets))
+    context = yield (2, 3)
+
+    if refBlenderLength == 0:
+        return "The reference model needs a length on the chosen axis"
+
+    targetLengths = np.array(targetLengths, dtype=np.float64)
+    measurable = (targetBlenderLengths > 0) & (targetLengths > 0)
+    newScales = np.zeros(len(targets))
+    newScales[measurable] = (refBlenderLength / targetBlenderLengths[measurable]) * (targetLengths[measurable] / refLength)
+
+    # Scale all targets
+    skipped = []
+    for obj, newScale, isMeasurable in zip(targets, newScales, measurable):
+        if not isMeasurable:
+            skipped.append(obj.name)
+            continue
+        previousScales[obj.name] = tuple(obj.scale)
+        obj.scale = (float(newScale),) * 3
+
+    if skipped:
+        operator.report({"WARNING"}, "Targets without a length were not scaled: " + ", ".join(skipped))
+    yield (3, 3)
+
+    return None
+
+def getEditBoneIndices(armature : Armature, editBones : list):
+    '''Index of every edit bone in armature.edit_bones as numpy array'''
+    indexOf = {bone.name : i for i, bone in enumerate(armature.edit_bones)}
+    return np.array([indexOf[bone.name] for bone in editBones], dtype=np.int64)
+
+def readEditBoneArray(armature : Armature, attribute : str, size : int = 1):
+    '''The attribute of all edit bones as (n, size) float64 array, or (n,) for single values'''
+    editBones = armature.edit_bones
+    values = np.empty(len(editBones) * size, dtype=np.float32)
+    editBones.foreach_get(attribute, values)
+    values = values.astype(np.float64)
+    return values.reshape(-1, size) if size > 1 else values
+
+def writeEditBoneArray(armature : Armature, attribute : str, values):
+    editBones = armature.edit_bones
+    editBones.foreach_set(attribute, np.ascontiguousarray(values, dtype=np.float32).ravel())
+
+def advanceSteps(steps, context):
+    '''Runs the next step of a step generator. Steps get the current context back from their yield,
+    the context they were created with is not valid anymore in a modal operator'''
+    if inspect.getgeneratorstate(steps) == inspect.GEN_CREATED:
+        return next(steps)
+    return steps.send(context)
+
+def runSteps(steps, context = None):
+    '''Runs a step generator to the end and returns its return value'''
+    while True:
+        try:
+            advanceSteps(steps, context)
+        except StopIteration as stop:
+            return stop.value
 
 ###############################################################
 # Parent All Bones:                                           #
@@ -20,69 +504,34 @@ class EAWU_OT_ParentAllBones(Operator):
 
     bl_idname = "object.parent_all_bones"
     bl_label = "Parent all Bones"
-    bl_description = "Parent all bones from the active armature based on the distance to eachother"
+    bl_description = "Parent all bones from the chosen armatures based on the distance to eachother"
 
     @classmethod
     def poll(cls, context):
-        obj = context.object
-        
-        if obj is not None:
-            if obj.type == "ARMATURE":
-                return True
+        scene = context.scene
+        properties = EAWU_Properties(scene.eaw_utility)
+
+        if getArmatureObjects(context, properties.parentArmatureScope):
+            return True
 
         return False
 
     def execute(self, context):
         scene = context.scene
-        armature = Armature(context.object.data)
-        properties = scene.eaw_utility
-
-        # Get Properties
-        distanceThreshold = properties.distanceThreshold
+        properties = EAWU_Properties(scene.eaw_utility)
+        viewLayer = context.view_layer
 
-        shouldAddContainerBone = properties.shouldAddContainerBone
-        containerBoneSufix = properties.containerBoneSufix
+        armatureObjects = [obj for obj in getArmatureObjects(context, properties.parentArmatureScope) if obj.visible_get()]
+        if not armatureObjects:
+            self.report({"ERROR"}, "No visible armature found")
+            return {"CANCELLED"}
 
-        parentBonesPrefix = properties.parentBonesPrefix
-        childBonesPrefix = properties.childBonesPrefix
+        # Enter and leave Edit Mode once for all armatures
+        previous = enterArmatureEditMode(context, armatureObjects)
+        results = parentBones(properties, armatureObjects)
+        leaveArmatureEditMode(context, previous)
 
-        # Goto Edit Mode
-        bpy.ops.object.mode_set(mode='EDIT', toggle=False)
-
-        # Loop through bones
-        for bone in armature.bones:
-
-            # Test if is valid Parent
-            if bone.name.startswith(parentBonesPrefix):
-                for child in armature.bones:
-
-                    # Test if child.name starts with the childPrefix, child.name and bone.name are unequal and the child has no parent
-                    if child.name.startswith(childBonesPrefix) and child.name != bone.name and child.parent == None:
-                        loc1 = Vector(bone.head_local)
-                        loc2 = Vector(child.head_local)
-                        dist = (loc2 - loc1).length
-
-                        if dist <= distanceThreshold:
-                            editBones = armature.edit_bones
-                            parent = editBones[bone.name]
-
-                            if shouldAddContainerBone:
-                                # Add Container Bone
-                                editBone = editBones.new(bone.name + containerBoneSufix)
-                                editBone.tail = bone.tail_local
-                                editBone.head = bone.head_local
-                                editBone.parent = parent
-                                # Adjust the Parent for the child
-                                parent = editBone
-                            
-                            # Set the correct parent for the child
-                            editChild = editBones[child.name]
-                            editChild.parent = parent
-
-                            break
-
-        # Goto Object Mode
-        bpy.ops.object.mode_set(mode='OBJECT', toggle=False)
+        self.report({"INFO"}, "Parented children per armature - " + ", ".join(results))
 
         return {"FINISHED"}
 
@@ -111,10 +560,7 @@ class EAWU_OT_SelectBonesRandomly(Operator):
         armature = Armature(context.object.data)
         properties = EAWU_Properties(scene.eaw_utility)
 
-        # Get Properties
         randomBoneCount = properties.randomBoneCount
-        spaceBonesByDistance = properties.spaceBonesByDistance
-        minimalBoneDistance = properties.minimalBoneDistance
 
         # Goto Edit Mode
         bpy.ops.object.mode_set(mode='EDIT', toggle=False)
@@ -124,48 +570,10 @@ class EAWU_OT_SelectBonesRandomly(Operator):
         if randomBoneCount > length:
             return {"CANCELLED"}
 
-        properties.previewBonesInRange = False
-
-        selectedIndecies = {}
-
-        editBones = armature.edit_bones
-
-        for bone in armature.bones:
-            tmp = editBones.get(bone.name)
-            if tmp:
-                editBone = EditBone(tmp)
-                editBone.select = False
-                editBone.select_head = False
-                editBone.select_tail = False
-
-        i = 0
-        while i < randomBoneCount:
-            index = random.randint(0, length - 1)
-
-            # Get closest distance to bones already selected
-            closestDistance = sys.float_info.max
-            for x in selectedIndecies:
-                bone1 = armature.bones[x]
-                bone2 = armature.bones[index]
-                loc1 = Vector(bone1.head_local)
-                loc2 = Vector(bone2.head_local)
-                dist = (loc2 - loc1).length
-
-                if dist < closestDistance:
-                    closestDistance = dist
-
-            if not index in selectedIndecies:
-                if spaceBonesByDistance and closestDistance < minimalBoneDistance:
-                    continue
-
-                selectedIndecies[i] = index
-                bone = armature.bones[index]
-                if bone != None:
-                    editBone = EditBone(editBones.get(bone.name))
-                    editBone.select = True
-                    editBone.select_head = True
-                    editBone.select_tail = True
-                    i += 1
+        selectedCount = selectBonesRandomly(properties, EditBoneLookup(armature))
+
+        if selectedCount < randomBoneCount:
+            self.report({"WARNING"}, "Only " + str(selectedCount) + " of " + str(randomBoneCount) + " bones could be placed with the minimal distance")
 
         return {"FINISHED"}
 
@@ -193,11 +601,13 @@ class EAWU_OT_RenameSelectedBones(Operator):
         scene = context.scene
         properties = EAWU_Properties(scene.eaw_utility)
 
-        selectedBones = context.selected_bones
+        armature = Armature(context.object.data)
 
-        for i in range(0, len(selectedBones)):
-            bone = selectedBones[i]
-            bone.name = adjustBoneNameByProperties(context, properties, bone, i)
+        try:
+            renameBones(context, properties, list(context.selected_bones), EditBoneLookup(armature))
+        except re.error as error:
+            self.report({"ERROR"}, "Invalid Match Pattern: " + str(error))
+            return {"CANCELLED"}
 
         return {"FINISHED"}
 
@@ -228,40 +638,7 @@ class EAWU_OT_RenameByWeight(Operator):
         properties = EAWU_Properties(scene.eaw_utility)
         armature = Armature(context.object.data)
 
-        selectedBones = context.selected_bones
-        selectedCount = len(selectedBones)
-
-        # Copy important Values
-        weightList = properties.renameWeightList
-        weights = []
-        names = []
-        totalWeights = 0
-        for item in weightList:
-            totalWeights += item.weight
-            weights.append(item.weight)
-            names.append(item.value)
-        weightStepSize = totalWeights / selectedCount
-
-        for bone in selectedBones:
-            randomIndex = random.randint(0, len(names) - 1)
-            newName = names[randomIndex]
-            # Update weight
-            weights[randomIndex] -= weightStepSize
-            # Remove weight and name if neccessary
-            if weights[randomIndex] <= 0:
-                weights.remove(weights[randomIndex])
-                names.remove(newName)
-            
-            # Update name
-            bone.name = newName
-            if properties.shouldChangeAlamoProperties:
-                # Update Alamo Bone Properties (Changing mode not required, because we are already in it)
-                editBone = EditBone(armature.edit_bones.get(bone.name))
-                try:
-                    editBone.EnableProxy = True
-                    editBone.ProxyName = newName
-                except:
-                    print("The Alamo Object Import plugin is not installed")
+        renameBonesByWeight(properties, list(context.selected_bones), EditBoneLookup(armature))
 
         return {"FINISHED"}
 
@@ -294,79 +671,9 @@ class EAWU_OT_RotateBones(Operator):
     def execute(self, context):
         scene = context.scene
         properties = EAWU_Properties(scene.eaw_utility)
-        armature = Armature(context.object.data)
 
-        selectedBones = context.selected_bones
-
-        # Get Properties
-        rotatingMehtod = properties.rotatingMethod
-        useNormalMesh = properties.useNormalObject
-        normalMeshName = properties.normalObject
-        facingAxis = properties.facingAxis
-
-        if rotatingMehtod == "NORMAL_DIRECTION":
-            for bone in selectedBones: 
-                boneLoc = Vector(bone.head)
-
-                # Get Closest Vertex
-                closestVertex = None
-                closestDistance = sys.float_info.max
-                # Use custom Normal Mesh
-                if useNormalMesh:
-                    # Find correct Mesh
-                    outer = None
-                    for obj in scene.objects:
-                        if obj.data.name == normalMeshName:
-                            outer = obj
-                    # Stop if outer is None
-                    if outer == None: return {"CANCELLED"}
-                    mesh = Mesh(outer.data)
-                    for vertex in mesh.vertices:
-                        vertexLoc = Vector(outer.matrix_world @ vertex.co)
-                        dist = (vertexLoc - boneLoc).length
-                        if dist < closestDistance:
-                            closestDistance = dist
-                            closestVertex = vertex
-                # Use all meshes as Normal Mesh
-                else:
-                    objects = scene.objects
-                    for outer in objects:
-                        if outer.type == "MESH":
-                            mesh = Mesh(outer.data)
-                            for vertex in mesh.vertices:
-                                vertexLoc = Vector(outer.matrix_world @ vertex.co)
-                                dist = (vertexLoc - boneLoc).length
-                                if dist < closestDistance:
-                                    closestDistance = dist
-                                    closestVertex = vertex
-                
-                # Get Vertex Normal
-                if closestVertex != None:
-                    normal = closestVertex.normal.copy()
-                    
-                    # Define Up axis
-                    tail = Vector((0,0,1))
-                    if facingAxis == "X_AXIS" or facingAxis == "Z_AXIS":
-                        tail = Vector((0,1,0))
-                    elif facingAxis == "Y_AXIS":
-                        tail = Vector((1,0,0))
-                    
-                    # Save offset to Origin
-                    originOffset = -bone.head
-                    # Apply Facepreset
-                    bone.head = Vector((0,0,0))
-                    bone.tail = tail
-                    bone.roll = 0
-
-                    # Create Rotation Matrix
-                    rotMatrix = lookAt(boneLoc, normal, Vector((0,0,1)))
-                    eulerRot = Euler(rotMatrix.to_euler())
-
-                    # Rotate Bone
-                    bone.transform(eulerRot.to_matrix(), scale=False)
-                    # Special Case Z Axis
-                    if facingAxis == "Z_AXIS": bone.roll += radians(90)
-                    bone.translate(-originOffset)
+        if not rotateBones(context, properties, list(context.selected_bones)):
+            return {"CANCELLED"}
 
         return {"FINISHED"}
     
@@ -385,34 +692,342 @@ class EAWU_OT_ScaleByReference(Operator):
         scene = context.scene
         properties = EAWU_Properties(scene.eaw_utility)
 
-        if properties.refModel != "" and properties.targetModel != "" and properties.refModelLength > 0 and properties.targetModelLength > 0:
-            return True
+        if properties.refModel == "" or properties.refModelLength <= 0:
+            return False
+
+        if properties.scaleTargetSource == "COLLECTION":
+            return properties.targetCollection != ""
+        if properties.scaleTargetSource == "CSV":
+            return properties.targetCSVPath != ""
+
+        return properties.targetModel != "" and properties.targetModelLength > 0
+
+    def execute(self, context):
+        scene = context.scene
+        properties = EAWU_Properties(scene.eaw_utility)
+
+        error = runSteps(scaleByReferenceSteps(self, context, properties, {}), context)
+        if error != None:
+            self.report({"ERROR"}, error)
+            return {"CANCELLED"}
+
+        return {"FINISHED"}
+
+#######################################
+# Run Pipeline:                       #
+# Run several steps in one Edit Mode  #
+#######################################
+class EAWU_OT_RunPipeline(Operator):
+
+    bl_idname = "object.run_eaw_pipeline"
+    bl_label = "Run Pipeline"
+    bl_description = "Run the chosen bone utilities one after another without leaving Edit Mode in between"
+
+    @classmethod
+    def poll(cls, context):
+        scene = context.scene
+        properties = EAWU_Properties(scene.eaw_utility)
+        obj = context.object
+
+        if obj is not None:
+            if obj.type == "ARMATURE" and (properties.pipelineParent or properties.pipelineSelectRandom or properties.pipelineRename or
+                                           properties.pipelineRenameByWeight or properties.pipelineRotate):
+                return True
 
         return False
 
     def execute(self, context):
         scene = context.scene
+        armature = Armature(context.object.data)
         properties = EAWU_Properties(scene.eaw_utility)
 
-        # Get Properties
-        refMesh = properties.refModel
-        refLength = properties.refModelLength
-        targetMesh = properties.targetModel
-        targetLength = properties.targetModelLength
-        axis = properties.lengthAxis
+        if properties.pipelineSelectRandom and properties.randomBoneCount > len(armature.bones):
+            self.report({"ERROR"}, "The armature has less bones than the random bone count")
+            return {"CANCELLED"}
+        if properties.pipelineRenameByWeight and not properties.renameWeightList:
+            self.report({"ERROR"}, "The Weightlist is empty")
+            return {"CANCELLED"}
+        if properties.pipelineRotate and properties.useNormalObject and properties.normalObject == "":
+            self.report({"ERROR"}, "Choose a valid Mesh as Source Object")
+            return {"CANCELLED"}
+
+        # Enter Edit Mode once for the active armature and the armatures to parent, look up the edit bones once for all steps
+        previousMode = context.object.mode
+        parentObjects = [obj for obj in getArmatureObjects(context, properties.parentArmatureScope) if obj.visible_get()] if properties.pipelineParent else []
+        previous = enterArmatureEditMode(context, [context.object] + [obj for obj in parentObjects if obj != context.object])
+        steps = []
+
+        if parentObjects:
+            steps.append("parented " + ", ".join(parentBones(properties, parentObjects)))
+
+        # Parenting may have added container bones
+        editBones = EditBoneLookup(armature)
+
+        if properties.pipelineSelectRandom:
+            steps.append("selected " + str(selectBonesRandomly(properties, editBones)))
+
+        # The selection only changes in the select step
+        selectedBones = [bone for bone in editBones.values() if bone.select]
 
-        # Calculate required values
-        scaleRatio = targetLength / refLength
-        refBlenderLength = getModelLength(self, context, refMesh, axis)
-        targetBlenderLength = getModelLength(self, context, targetMesh, axis)
+        if properties.pipelineRename:
+            try:
+                renameBones(context, properties, selectedBones, editBones)
+                steps.append("renamed " + str(len(selectedBones)))
+            except re.error as error:
+                self.report({"WARNING"}, "Invalid Match Pattern, the bones were not renamed: " + str(error))
 
-        # Scale target
-        newScale = (refBlenderLength / targetBlenderLength) * scaleRatio
-        for obj in scene.objects:
-            if obj.data.name == targetMesh:
-                obj.scale.x = newScale
-                obj.scale.y = newScale
-                obj.scale.z = newScale
+        if properties.pipelineRenameByWeight and selectedBones:
+            renameBonesByWeight(properties, selectedBones, editBones)
+            steps.append("renamed " + str(len(selectedBones)) + " by weight")
 
+        if properties.pipelineRotate and selectedBones:
+            if not rotateBones(context, properties, selectedBones):
+                self.report({"WARNING"}, "No source mesh found, the bones were not rotated")
+            else:
+                steps.append("rotated " + str(len(selectedBones)))
 
-        return {"FINISHED"}
\ No newline at end of file
+        # Leave Edit Mode once, the edit bones are written back to the armature here
+        leaveArmatureEditMode(context, previous, previousMode)
+
+        self.report({"INFO"}, "Pipeline: " + (", ".join(steps) if steps else "nothing to do"))
+
+        return {"FINISHED"}
+
+#######################################
+# Modal Operators:                    #
+# Run long utilities in time slices   #
+#######################################
+class EAWU_ChunkedModal:
+    '''Runs the step generator returned by self.start(context) in short time slices on a timer, so Blender stays responsive.
+    Shows the progress in the status bar, ESC cancels and calls self.rollback(context)'''
+
+    # Seconds of work per timer event
+    timeSlice = 0.05
+
+    def invoke(self, context, event):
+        self.record = ProfileRecord(self.bl_idname + ".modal", "operator")
+        self.startTime = time.perf_counter()
+        profiler.resume(self.record)
+        try:
+            self.steps = self.start(context)
+        finally:
+            profiler.pause()
+        if self.steps == None:
+            return {"CANCELLED"}
+
+        self.progress = (0, 1)
+        windowManager = context.window_manager
+        self.timer = windowManager.event_timer_add(0.01, window=context.window)
+        windowManager.modal_handler_add(self)
+        windowManager.progress_begin(0, 100)
+        context.workspace.status_text_set(self.bl_label + ": starting (ESC to cancel)")
+
+        return {"RUNNING_MODAL"}
+
+    def modal(self, context, event):
+        if event.type == "ESC":
+            self.stop(context)
+            self.rollback(context)
+            self.report({"WARNING"}, self.bl_label + " was cancelled, the changes were reverted")
+            return {"CANCELLED"}
+
+        # Everything else goes to Blender, so the viewport can still be used
+        if event.type != "TIMER":
+            return {"PASS_THROUGH"}
+
+        if not self.isValid(context):
+            self.stop(context)
+            self.report({"WARNING"}, self.bl_label + " was stopped, the armature left Edit Mode")
+            return {"CANCELLED"}
+
+        deadline = time.perf_counter() + self.timeSlice
+        profiler.resume(self.record)
+        try:
+            while time.perf_counter() < deadline:
+                self.progress = advanceSteps(self.steps, context)
+        except StopIteration as stop:
+            self.stop(context)
+            return self.finish(context, stop.value)
+        except Exception as error:
+            self.stop(context)
+            self.rollback(context)
+            self.report({"ERROR"}, self.bl_label + " failed, the changes were reverted: " + str(error))
+            return {"CANCELLED"}
+        finally:
+            profiler.pause()
+
+        done, total = self.progress
+        percent = int(100 * done / total) if total > 0 else 100
+        context.window_manager.progress_update(percent)
+        context.workspace.status_text_set(self.bl_label + ": " + str(done) + "/" + str(total) + " (" + str(percent) + "%, ESC to cancel)")
+
+        return {"RUNNING_MODAL"}
+
+    def stop(self, context):
+        windowManager = context.window_manager
+        windowManager.event_timer_remove(self.timer)
+        windowManager.progress_end()
+        context.workspace.status_text_set(None)
+
+        # The whole run from invoke to the end, including the time Blender spent between the slices
+        self.record.wallTime = time.perf_counter() - self.startTime
+        profiler.add(self.record)
+
+    def isValid(self, context):
+        return True
+
+class EAWU_OT_RotateBonesModal(EAWU_ChunkedModal, Operator):
+
+    bl_idname = "object.rotate_bones_modal"
+    bl_label = "Rotate Bones"
+    bl_description = "Rotate bones using a specified method in the background with progress. ESC cancels and reverts the rotation"
+
+    @classmethod
+    def poll(cls, context):
+        return EAWU_OT_RotateBones.poll(context)
+
+    def start(self, context):
+        scene = context.scene
+        properties = EAWU_Properties(scene.eaw_utility)
+
+        self.armatureObject = context.object
+        selectedBones = list(context.selected_bones)
+        # Keep the bones as they are for the rollback
+        self.previousBones = [(bone.id_data.name, bone.name, bone.head.copy(), bone.tail.copy(), bone.roll) for bone in selectedBones]
+
+        return rotateBoneSteps(context, properties, selectedBones)
+
+    def isValid(self, context):
+        return self.armatureObject.mode == "EDIT"
+
+    def rollback(self, context):
+        if self.armatureObject.mode != "EDIT":
+            return
+
+        # The selection can hold bones of several armatures in multi-object Edit Mode
+        lookups = {}
+        for armatureName, name, head, tail, roll in self.previousBones:
+            armature = bpy.data.armatures.get(armatureName)
+            if armature == None:
+                continue
+            if armatureName not in lookups:
+                lookups[armatureName] = EditBoneLookup(armature)
+            bone = lookups[armatureName].get(name)
+            if bone != None:
+                bone.head = head
+                bone.tail = tail
+                bone.roll = roll
+
+    def finish(self, context, result):
+        if not result:
+            self.report({"ERROR"}, "No source mesh with vertices found")
+            return {"CANCELLED"}
+
+        return {"FINISHED"}
+
+class EAWU_OT_ParentAllBonesModal(EAWU_ChunkedModal, Operator):
+
+    bl_idname = "object.parent_all_bones_modal"
+    bl_label = "Parent all Bones"
+    bl_description = "Parent all bones from the chosen armatures in the background with progress. ESC cancels and reverts the parenting"
+
+    @classmethod
+    def poll(cls, context):
+        return EAWU_OT_ParentAllBones.poll(context)
+
+    def start(self, context):
+        scene = context.scene
+        properties = EAWU_Properties(scene.eaw_utility)
+
+        armatureObjects = [obj for obj in getArmatureObjects(context, properties.parentArmatureScope) if obj.visible_get()]
+        if not armatureObjects:
+            self.report({"ERROR"}, "No visible armature found")
+            return None
+
+        # All armatures stay in Edit Mode until the run ends
+        self.previous = enterArmatureEditMode(context, armatureObjects)
+        self.armatureObjects = armatureObjects
+        self.changes = []
+        return parentBoneSteps(properties, armatureObjects, self.changes)
+
+    def isValid(self, context):
+        # The edit bones are freed when the armatures leave Edit Mode (Tab, undo), the lookups would point to freed memory
+        try:
+            activeObject = context.view_layer.objects.active
+            return activeObject in self.armatureObjects and all(obj.mode == "EDIT" for obj in self.armatureObjects)
+        except ReferenceError:
+            # Undo replaced the objects
+            return False
+
+    def rollback(self, context):
+        revertParentChanges(self.changes)
+        leaveArmatureEditMode(context, self.previous)
+
+    def finish(self, context, results):
+        leaveArmatureEditMode(context, self.previous)
+        self.report({"INFO"}, "Parented children per armature - " + ", ".join(results))
+        return {"FINISHED"}
+
+class EAWU_OT_ScaleByReferenceModal(EAWU_ChunkedModal, Operator):
+
+    bl_idname = "object.scale_by_reference_modal"
+    bl_label = "Scale by Reference"
+    bl_description = "Scale the target mesh by the specified method in the background with progress. ESC cancels and restores the scale"
+
+    @classmethod
+    def poll(cls, context):
+        return EAWU_OT_ScaleByReference.poll(context)
+
+    def start(self, context):
+        scene = context.scene
+        properties = EAWU_Properties(scene.eaw_utility)
+
+        self.previousScales = {}
+        return scaleByReferenceSteps(self, context, properties, self.previousScales)
+
+    def rollback(self, context):
+        for name, scale in self.previousScales.items():
+            obj = bpy.data.objects.get(name)
+            if obj != None:
+                obj.scale = scale
+
+    def finish(self, context, error):
+        if error != None:
+            self.report({"ERROR"}, error)
+            return {"CANCELLED"}
+
+        return {"FINISHED"}
+
+#######################################
+# Performance:                        #
+# Export or clear the timings         #
+#######################################
+class EAWU_OT_ExportProfile(Operator, ExportHelper):
+
+    bl_idname = "object.export_eaw_profile"
+    bl_label = "Export Timings"
+    bl_description = "Export the recorded timings of the operators and updates as JSON"
+
+    filename_ext = ".json"
+
+    filter_glob : StringProperty(
+        default = "*.json",
+        options = {"HIDDEN"},
+    )
+
+    def execute(self, context):
+        profiler.export(self.filepath)
+        self.report({"INFO"}, str(len(profiler.records)) + " timings exported to " + self.filepath)
+
+        return {"FINISHED"}
+
+class EAWU_OT_ClearProfile(Operator):
+
+    bl_idname = "object.clear_eaw_profile"
+    bl_label = "Clear Timings"
+    bl_description = "Remove all recorded timings"
+
+    def execute(self, context):
+        profiler.clear()
+
+        return {"FINISHED"}
@@ -0,0 +1,159 @@
+import bpy
+
+import cProfile
+
+import functools
+
+import io
+
+import json
+
+import pstats
+
+import time
+
+import tracemalloc
+
+from collections import deque
+
+# Records kept in the ring buffer
+PROFILE_BUFFER_SIZE = 200
+# Functions listed from a cProfile run
+PROFILE_STATS_LINES = 20
+
+class ProfileRecord:
+    '''Timing of one operator run or property update with the counted elements'''
+
+    def __init__(self, name : str, kind : str):
+        self.name = name
+        self.kind = kind
+        self.started = time.time()
+        self.wallTime = 0.0
+        self.counts = {}
+        self.result = ""
+        self.memoryPeak = None
+        self.profileStats = None
+
+    def toDict(self) -> dict:
+        return {
+            "name" : self.name,
+            "kind" : self.kind,
+            "started" : self.started,
+            "wallTime" : self.wallTime,
+            "counts" : self.counts,
+            "result" : self.result,
+            "memoryPeak" : self.memoryPeak,
+            "profileStats" : self.profileStats,
+        }
+
+    def summary(self) -> str:
+        counts = ", ".join(name + " " + str(value) for name, value in self.counts.items())
+        return self.name + ": " + "%.1f ms" % (self.wallTime * 1000) + (" (" + counts + ")" if counts else "")
+
+class Profiler:
+    '''Ring buffer of ProfileRecords. Runs can be nested (an update inside an operator),
+    cProfile and tracemalloc only cover the outermost run'''
+
+    def __init__(self, size : int = PROFILE_BUFFER_SIZE):
+        self.records = deque(maxlen=size)
+        self.active = []
+
+    def settings(self):
+        scene = bpy.context.scene
+        properties = getattr(scene, "eaw_utility", None) if scene != None else None
+        if properties == None:
+            return False, False
+        return properties.profileWithCProfile, properties.profileMemory
+
+    def run(self, name : str, kind : str, function, *args, **kwargs):
+        record = ProfileRecord(name, kind)
+        outermost = not self.active
+        useCProfile, useTracemalloc = self.settings() if outermost else (False, False)
+
+        profile = cProfile.Profile() if useCProfile else None
+        startedTracing = useTracemalloc and not tracemalloc.is_tracing()
+        if startedTracing:
+            tracemalloc.start()
+        elif useTracemalloc:
+            tracemalloc.reset_peak()
+
+        self.active.append(record)
+        start = time.perf_counter()
+        try:
+            if profile != None:
+                result = profile.runcall(function, *args, **kwargs)
+            else:
+                result = function(*args, **kwargs)
+            record.result = str(result) if result != None else ""
+            return result
+        finally:
+            record.wallTime = time.perf_counter() - start
+            self.active.pop()
+
+            if useTracemalloc:
+                record.memoryPeak = tracemalloc.get_traced_memory()[1]
+                if startedTracing:
+                    tracemalloc.stop()
+            if profile != None:
+                stream = io.StringIO()
+                pstats.Stats(profile, stream=stream).sort_stats("cumulative").print_stats(PROFILE_STATS_LINES)
+                record.profileStats = stream.getvalue()
+
+            self.records.append(record)
+
+    def add(self, record : ProfileRecord):
+        '''Adds a record which was timed by the caller, e.g. a modal operator from start to end'''
+        self.records.append(record)
+
+    def resume(self, record : ProfileRecord):
+        '''Counts go to the record until pause is called, for work split over several calls'''
+        self.active.append(record)
+
+    def pause(self):
+        self.active.pop()
+
+    def count(self, name : str, value : int):
+        '''Adds an element count (bones, vertices, matches, ...) to the running record'''
+        if self.active:
+            counts = self.active[-1].counts
+            counts[name] = counts.get(name, 0) + value
+
+    def clear(self):
+        self.records.clear()
+
+    def export(self, filepath : str):
+        with open(filepath, "w") as file:
+            json.dump([record.toDict() for record in self.records], file, indent=4)
+
+profiler = Profiler()
+
+def profiled(name : str = None, kind : str = "update"):
+    '''Decorator recording every call of the function in the profiler.
+    Blender checks the argument count of update callbacks and operator methods, so the wrapper keeps it'''
+    def decorator(function):
+        recordName = name if name != None else function.__name__
+
+        if function.__code__.co_argcount == 2:
+            def wrapper(self, context):
+                return profiler.run(recordName, kind, function, self, context)
+        elif function.__code__.co_argcount == 3:
+            def wrapper(self, context, event):
+                return profiler.run(recordName, kind, function, self, context, event)
+        else:
+            def wrapper(*args, **kwargs):
+                return profiler.run(recordName, kind, function, *args, **kwargs)
+
+        functools.update_wrapper(wrapper, function)
+        wrapper.isProfiled = True
+        return wrapper
+    return decorator
+
+def instrumentOperators(classes):
+    '''Wraps execute and invoke of all EAWU operators, call it before the classes are registered'''
+    for cls in classes:
+        if not cls.__name__.startswith("EAWU_OT_"):
+            continue
+        for methodName in ("execute", "invoke"):
+            method = cls.__dict__.get(methodName)
+            if method != None and not getattr(method, "isProfiled", False):
+                setattr(cls, methodName, profiled(cls.bl_idname + "." + methodName, "operator")(method))
@@ -2,6 +2,8 @@ import bpy
 
 import sys
 
+import numpy as np
+
 from bpy.props import (StringProperty,
                        BoolProperty,
                        IntProperty,
@@ -17,6 +19,12 @@ from bpy.types import (PropertyGroup,
 
 from mathutils import Vector
 
+from . eaw_utility_geometry import (getArmatureObjects, getBoneHeads, getChildrenCoverages, getClosestBoneDistances, getPreviewParentLocations,
+                                    hasChildrenCoverages, hasClosestBoneDistances, hasPreviewParentLocations)
+from . ui.eaw_utility_overlay import (PREVIEW_RING_LIMIT, bonesInRangePreview, thresholdPreview)
+from . eaw_utility_profiling import (profiled, profiler)
+from . eaw_utility_timers import debouncer
+
 class EAWU_WightlistItem(PropertyGroup):
 
     value : StringProperty(
@@ -33,6 +41,26 @@ class EAWU_WightlistItem(PropertyGroup):
         max = 1.0,
     )
 
+class EAWU_CoverageItem(PropertyGroup):
+
+    armatureName : StringProperty(
+        name = "Armature",
+    )
+
+    coverage : StringProperty(
+        name = "Children Coverage",
+    )
+
+def sceneProperties():
+    # Deferred updates run from a timer, the properties are looked up again when they run
+    return EAWU_Properties(bpy.context.scene.eaw_utility)
+
+def formatCoverage(childrenInRange : int, childrenCount : int) -> str:
+    if childrenCount == 0:
+        return "All children are parented"
+
+    return str(int((childrenInRange/childrenCount)*100)) + "% (" + str(childrenInRange) + "/" + str(childrenCount) + ")"
+
 class EAWU_Properties(PropertyGroup):
 
     utils = [
@@ -41,7 +69,8 @@ class EAWU_Properties(PropertyGroup):
                 ("RENAME_BONES", "Rename Bones", "Rename all selected bones", "", 2),
                 ("RENAME_BONES_BY_LIST", "Rename Bones by Weightlist", "Rename all selected bones using a Weightlist", "", 3),
                 ("ROTATE_BONES", "Rotate Bones", "Rotate all selected bones is specific direction", "", 4),
-                ("SCALE_CORRECT", "Scale by Reference", "Scale a target model by a reference model with lengths", "", 5)
+                ("SCALE_CORRECT", "Scale by Reference", "Scale a target model by a reference model with lengths", "", 5),
+                ("PIPELINE", "Pipeline", "Run several bone utilities one after another in a single Edit Mode session", "", 6)
             ]
 
     # General Properties
@@ -53,79 +82,99 @@ class EAWU_Properties(PropertyGroup):
         default = "PARENT_BONES"
     )
 
+    runInBackground : BoolProperty(
+        name = "Run in Background",
+        description = "Parent, Rotate and Scale run in small steps with a progress bar, Blender stays usable and ESC cancels and reverts the changes",
+        default = False,
+    )
+
     # Parent all Bones Properties
 
+    @profiled()
     def updateChildrenCoverage(self, context):
         scene = context.scene
         properties = EAWU_Properties(scene.eaw_utility)
 
-        armature = None
-        for obj in scene.objects:
-            if obj.type == "ARMATURE":
-                armature = Armature(obj.data)
-
-        childrenWithoutParent = 0
-        childrenWithParent = 0
-        childrenCount = 0
-        children = 0
-
-        if armature != None:
-            for bone in armature.bones:
-                # Count the total amount of children matching the childPrefix
-                if bone.name.startswith(properties.childBonesPrefix):
-                    childrenCount += 1
-                    children += 1
-
-                    if bone.parent != None:
-                        childrenWithParent += 1
-
-                # Count Children that will have a parent
-                if bone.name.startswith(properties.parentBonesPrefix) and not bone.name.endswith(properties.containerBoneSufix):
-                    for child in armature.bones:
-                        
-                        if child.name.startswith(properties.childBonesPrefix) and child.name != bone.name and child.parent == None:
-                            loc1 = Vector(bone.head_local)
-                            loc2 = Vector(child.head_local)
-                            dist = (loc2 - loc1).length
-
-                            if dist <= properties.distanceThreshold:
-                                childrenWithoutParent += 1
-
-        childrenCount -= childrenWithParent
-        #print(childrenWithoutParent, childrenWithParent, childrenCount, children)
-
-        if childrenWithParent == children:
-            properties.childrenCoverage = "All children are parented"
-        else:
-            properties.childrenCoverage = str(int((childrenWithoutParent/childrenCount)*100)) + "% (" + str(childrenWithoutParent) + "/" + str(childrenCount) + ")"
+        armatureObjects = getArmatureObjects(context, properties.parentArmatureScope)
+        properties.armatureCoverage.clear()
 
-    def distanceThresholdUpdated(self, context):
+        if not armatureObjects:
+            properties.childrenCoverage = "No Armature"
+            return
+
+        # The sorted parent -> closest child distances are cached until the bones or the prefixes change
+        coverages = getChildrenCoverages([Armature(obj.data) for obj in armatureObjects], properties.parentBonesPrefix, properties.childBonesPrefix, properties.containerBoneSufix)
+        profiler.count("armatures", len(armatureObjects))
+
+        totalCount = 0
+        totalInRange = 0
+        for obj, coverage in zip(armatureObjects, coverages):
+            childrenCount = coverage.childrenWithoutParent
+            childrenInRange = min(coverage.countInRange(properties.distanceThreshold), childrenCount)
+            totalCount += childrenCount
+            totalInRange += childrenInRange
+
+            item = properties.armatureCoverage.add()
+            item.armatureName = obj.name
+            item.coverage = formatCoverage(childrenInRange, childrenCount)
+
+        properties.childrenCoverage = formatCoverage(totalInRange, totalCount)
+
+    def drawThresholdRings(self, context, limit : int = None):
         scene = context.scene
         properties = EAWU_Properties(scene.eaw_utility)
 
-        properties.updateChildrenCoverage(context=context)
+        # Only the ring centers and the radius change, nothing is added to the scene
+        centers = []
+        for armatureObject in getArmatureObjects(context, properties.parentArmatureScope):
+            locations = getPreviewParentLocations(Armature(armatureObject.data), properties.parentBonesPrefix, properties.childBonesPrefix)
+            matrix = np.array(armatureObject.matrix_world, dtype=np.float32)
+            centers.append(locations @ matrix[:3, :3].T + matrix[:3, 3])
 
-        if not properties.previewThreshold:
-            return
+        if centers:
+            thresholdPreview.update(np.concatenate(centers), properties.distanceThreshold, limit)
+        else:
+            thresholdPreview.clear()
 
-        armature = None
-        for obj in scene.objects:
-            if obj.type == "ARMATURE":
-                armature = Armature(obj.data)
+    @profiled()
+    def applyDistanceThreshold(self, context):
+        scene = context.scene
+        properties = EAWU_Properties(scene.eaw_utility)
+
+        properties.updateChildrenCoverage(context=context)
 
-        if armature != None:
-            for bone in armature.bones:
+        if properties.previewThreshold:
+            properties.drawThresholdRings(context)
 
-                if bone.name.startswith(properties.parentBonesPrefix) and not bone.name.startswith(properties.childBonesPrefix) and bone.parent == None:
-                    circle = scene.objects.get(bone.name)
+    @profiled()
+    def distanceThresholdUpdated(self, context):
+        scene = context.scene
+        properties = EAWU_Properties(scene.eaw_utility)
 
-                    if circle != None and circle.data.name.startswith("Circle"):
-                        bpy.data.objects.remove(circle, do_unlink=True)
+        # While the slider is dragged only cached distances are used and a subset of the rings is drawn
+        armatureObjects = getArmatureObjects(context, properties.parentArmatureScope)
+        armatures = [Armature(obj.data) for obj in armatureObjects]
+        if hasChildrenCoverages(armatures, properties.parentBonesPrefix, properties.childBonesPrefix, properties.containerBoneSufix):
+            properties.updateChildrenCoverage(context=context)
+        if properties.previewThreshold and all(hasPreviewParentLocations(armature, properties.parentBonesPrefix, properties.childBonesPrefix) for armature in armatures):
+            properties.drawThresholdRings(context, PREVIEW_RING_LIMIT)
+
+        # The full update runs once the value stopped changing
+        debouncer.schedule("distanceThreshold", lambda: sceneProperties().applyDistanceThreshold(bpy.context))
+
+    armatureScopes = [
+                ("ACTIVE", "Active Armature", "Only the active armature", "", 0),
+                ("SELECTED", "Selected Armatures", "All selected armatures", "", 1),
+                ("ALL", "All Armatures", "All armatures in the scene", "", 2)
+            ]
 
-                    bpy.ops.mesh.primitive_circle_add(radius=properties.distanceThreshold, enter_editmode=False, align='WORLD', location=bone.head_local, scale=(1, 1, 1))
-                    circle = context.object
-                    circle.name = bone.name
-                    circle.show_in_front = True
+    parentArmatureScope : EnumProperty(
+        name = "Armatures",
+        description = "The armatures whose bones should be parented",
+        items = armatureScopes,
+        default = "ACTIVE",
+        update = distanceThresholdUpdated,
+    )
 
     distanceThreshold : FloatProperty(
         name = "",
@@ -145,45 +194,36 @@ class EAWU_Properties(PropertyGroup):
         name = "Container Sufix",
         description = "The container bone will become the child of the chosen parent and the child will be parented to the Container",
         default = "_DMG",
+        update = distanceThresholdUpdated,
     )
 
     parentBonesPrefix : StringProperty(
         name = "Parent Prefix",
         description = "All the bones with this prefix will be considered as possible parents",
         default = "HP_",
+        update = distanceThresholdUpdated,
     )
 
     childBonesPrefix : StringProperty(
         name = "Child Prefix",
         description = "All the bones with this prefix will be considered as possible children",
         default = "P_",
+        update = distanceThresholdUpdated,
     )
 
+    @profiled()
     def previewThresholdUpdated(self, context):
         scene = context.scene
         properties = EAWU_Properties(scene.eaw_utility)
 
         if properties.previewThreshold:
-            properties.distanceThresholdUpdated(context)
+            properties.drawThresholdRings(context)
         else:
-            armature = None
-            for obj in scene.objects:
-                if obj.type == "ARMATURE":
-                    armature = Armature(obj.data)
-
-            # Loop through bones
-            for bone in armature.bones:
-
-                # Test if is valid Parent
-                if bone.name.startswith(properties.parentBonesPrefix):
-                    circle = scene.objects.get(bone.name)
-
-                    if circle != None and circle.data.name.startswith("Circle"):
-                        bpy.data.objects.remove(circle, do_unlink=True)
+            thresholdPreview.clear()
 
     previewThreshold : BoolProperty(
         name = "Preview Threshold",
-        description = "If ticked circles will be generated which visualizes the Distance Threshold",
+        description = "If ticked circles will be drawn in the viewport which visualize the Distance Threshold",
         default = True,
         update=previewThresholdUpdated
     )
@@ -193,6 +233,10 @@ class EAWU_Properties(PropertyGroup):
         default = "0% (0/0)"
     )
 
+    armatureCoverage : CollectionProperty(
+        type = EAWU_CoverageItem,
+    )
+
     # Select random Bones Properties
 
     randomBoneCount : IntProperty(
@@ -208,33 +252,47 @@ class EAWU_Properties(PropertyGroup):
         default = True,
     )
 
-    def updateMininalBoneDistance(self, context):
+    def countBonesInRange(self, context):
         scene = context.scene
         properties = EAWU_Properties(scene.eaw_utility)
         # Get Armature
         obj = context.object
         armature = Armature(obj.data)
-        bonesInRange = 0
-        for bone1 in armature.bones:
-            closestDistance = sys.float_info.max
-            for bone2 in armature.bones:
-                if bone1.name != bone2.name:
-                    loc1 = Vector(bone1.head_local)
-                    loc2 = Vector(bone2.head_local)
-                    dist = (loc2 - loc1).length
-
-                    if dist < closestDistance:
-                        closestDistance = dist
-
-            if closestDistance >= properties.minimalBoneDistance:
-                bonesInRange += 1
-        
-        properties.bonesInRange = "Bones in Range: " + str(bonesInRange)+ "/" + str(len(armature.bones)) + " (inaccurate)"
+        # The closest distance of every bone is cached until the armature changes
+        bonesInRange = int(np.count_nonzero(getClosestBoneDistances(armature) >= properties.minimalBoneDistance))
+        profiler.count("bones", len(armature.bones))
+
+        properties.bonesInRange = "Bones in Range: " + str(bonesInRange)+ "/" + str(len(armature.bones))
 
         if bonesInRange < properties.randomBoneCount:
-            self.randomBonesButtonEnabled = False
+            properties.randomBonesButtonEnabled = False
         else:
-            self.randomBonesButtonEnabled = True
+            properties.randomBonesButtonEnabled = True
+
+    @profiled()
+    def applyMinimalBoneDistance(self, context):
+        scene = context.scene
+        properties = EAWU_Properties(scene.eaw_utility)
+
+        properties.countBonesInRange(context)
+        if properties.previewBonesInRange:
+            properties.applyPreviewBonesInRange(context)
+
+    @profiled()
+    def updateMininalBoneDistance(self, context):
+        scene = context.scene
+        properties = EAWU_Properties(scene.eaw_utility)
+
+        # While the slider is dragged the count and the points are only updated from cached distances
+        if hasClosestBoneDistances(Armature(context.object.data)):
+            properties.countBonesInRange(context)
+            if properties.previewBonesInRange:
+                properties.applyPreviewBonesInRange(context)
+        else:
+            properties.bonesInRange = "Bones in Range: ..."
+
+        # The full update runs once the value stopped changing
+        debouncer.schedule("minimalBoneDistance", lambda: sceneProperties().applyMinimalBoneDistance(bpy.context))
 
     minimalBoneDistance : FloatProperty(
         name = "",
@@ -251,39 +309,40 @@ class EAWU_Properties(PropertyGroup):
 
     bonesInRange : StringProperty(
         name = "Bones in Range",
-        default = 'Bones in range: (inaccurate)'
+        default = 'Bones in range: -'
     )
 
-    def updatePreviewBonesInRange(self, context):
+    @profiled()
+    def applyPreviewBonesInRange(self, context):
         scene = context.scene
         properties = EAWU_Properties(scene.eaw_utility)
         # Get Armature
         obj = context.object
+        if not properties.previewBonesInRange or obj == None or obj.type != "ARMATURE":
+            bonesInRangePreview.clear()
+            return
+
+        # The heads of the bones in range are drawn as points, the selection stays untouched
         armature = Armature(obj.data)
-        for bone1 in armature.bones:
-            editBone = EditBone(armature.edit_bones.get(bone1.name))
-            editBone.select = False
-            editBone.select_head = False
-            editBone.select_tail = False
-
-            if self.previewBonesInRange:
-                closestDistance = sys.float_info.max
-                for bone2 in armature.bones:
-                    if bone1.name != bone2.name:
-                        loc1 = Vector(bone1.head_local)
-                        loc2 = Vector(bone2.head_local)
-                        dist = (loc2 - loc1).length
-
-                        if dist < closestDistance:
-                            closestDistance = dist
-                    
-                if closestDistance >= properties.minimalBoneDistance:
-                    editBone.select = True
-                    editBone.select_head = True
-                    editBone.select_tail = True
+        inRange = getClosestBoneDistances(armature) >= properties.minimalBoneDistance
+        bonesInRangePreview.update(obj, getBoneHeads(armature)[inRange])
+        profiler.count("bones", len(armature.bones))
+
+    @profiled()
+    def updatePreviewBonesInRange(self, context):
+        scene = context.scene
+        properties = EAWU_Properties(scene.eaw_utility)
+
+        if not properties.previewBonesInRange:
+            debouncer.cancel("previewBonesInRange")
+            bonesInRangePreview.clear()
+            return
+
+        debouncer.schedule("previewBonesInRange", lambda: sceneProperties().applyPreviewBonesInRange(bpy.context))
 
     previewBonesInRange : BoolProperty(
-        name = "Preview Bones in Range (inaccurate)",
+        name = "Preview Bones in Range",
+        description = "Highlight the heads of the bones in range in the viewport, the selection is not changed",
         default = True,
         update = updatePreviewBonesInRange,
     )
@@ -321,6 +380,12 @@ class EAWU_Properties(PropertyGroup):
         default = "%s_%i",
     )
 
+    renameMatchPattern : StringProperty(
+        name = "Match Pattern",
+        description = "Regular expression searched in the old bone name, its groups can be used with %1 to %9 in the name preset",
+        default = "",
+    )
+
     enableRenamePreview : BoolProperty(
         name = "Enable Preview",
         description = "Show a preview of the first Item",
@@ -344,6 +409,13 @@ class EAWU_Properties(PropertyGroup):
         default = 0,
     )
 
+    renameSeed : IntProperty(
+        name = "Seed",
+        description = "The same seed, weights and bone count always give the same names. Change it for another distribution",
+        default = 0,
+        min = 0,
+    )
+
     shouldChangeAlamoProperties : BoolProperty(
         name = "Change Alamo Properties",
         description = "Changing Alamo Properties only works if the Alamo Importer by Gaukler is installed. It will change ProxyEnabled and ProxyName",
@@ -352,7 +424,10 @@ class EAWU_Properties(PropertyGroup):
 
     # Rotate Bones Properties
     
-    boneDirections = [("NORMAL_DIRECTION", "Normal Direction", "Rotate the Bone in the closest normal direction", "", 0)]
+    boneDirections = [
+                ("NORMAL_DIRECTION", "Normal Direction", "Rotate the Bone in the closest normal direction", "", 0),
+                ("SURFACE_NORMAL", "Closest Surface Normal", "Rotate the Bone in the normal direction at the closest point on the surface, more accurate on large faces", "", 1)
+            ]
 
     axis = [
             ("X_AXIS", "X Axis", "The red axis in the viewport", "", 0),
@@ -387,6 +462,13 @@ class EAWU_Properties(PropertyGroup):
         default = "",
     )
 
+    geometryCacheBudget : IntProperty(
+        name = "Geometry Cache (MB)",
+        description = "How much memory the cached mesh vertices, normals and search trees are allowed to use",
+        default = 256,
+        min = 1,
+    )
+
     # Scale by Reference Properties
 
     refModelLength : FloatProperty(
@@ -415,9 +497,93 @@ class EAWU_Properties(PropertyGroup):
         default = "",
     )
 
+    scaleTargetSources = [
+                ("SINGLE", "Single Target", "Scale the target model", "", 0),
+                ("COLLECTION", "Collection", "Scale every mesh in a collection, the real length is read from a custom property of each object", "", 1),
+                ("CSV", "CSV File", "Scale every target in a CSV file of target name and real length pairs", "", 2)
+            ]
+
+    scaleTargetSource : EnumProperty(
+        name = "Targets",
+        description = "The models which should be scaled by the reference",
+        items = scaleTargetSources,
+        default = "SINGLE",
+    )
+
+    targetCollection : StringProperty(
+        name = "",
+        description = "Every mesh in this collection and its child collections will be scaled",
+        default = "",
+    )
+
+    targetLengthProperty : StringProperty(
+        name = "Length Property",
+        description = "Custom property of each object with its real length, objects without it use the Target Model Length",
+        default = "realLength",
+    )
+
+    targetCSVPath : StringProperty(
+        name = "",
+        description = "CSV file with a target object or mesh name and its real length in every line",
+        default = "",
+        subtype = "FILE_PATH",
+    )
+
     lengthAxis : EnumProperty(
         name = "Length Axis",
         description = "The axis on which the length should be measured",
         items = axis,
         default = "Y_AXIS",
-    )
\ No newline at end of file
+    )
+
+    useBoundingBoxLength : BoolProperty(
+        name = "Fast Mode (Bounding Box)",
+        description = "Measure the length with the bounding box instead of every vertex. Only used if the model is not rotated",
+        default = False,
+    )
+
+    # Pipeline Properties
+
+    pipelineParent : BoolProperty(
+        name = "Parent Bones",
+        description = "Parent all matching child bones to the parent",
+        default = True,
+    )
+
+    pipelineSelectRandom : BoolProperty(
+        name = "Select Bones Randomly",
+        description = "Select bones randomly with the Select Bones Randomly options before the following steps",
+        default = False,
+    )
+
+    pipelineRename : BoolProperty(
+        name = "Rename Bones",
+        description = "Rename the selected bones with the Rename Bones options",
+        default = False,
+    )
+
+    pipelineRenameByWeight : BoolProperty(
+        name = "Rename Bones by Weightlist",
+        description = "Rename the selected bones with the Weightlist",
+        default = False,
+    )
+
+    pipelineRotate : BoolProperty(
+        name = "Rotate Bones",
+        description = "Rotate the selected bones with the Rotate Bones options",
+        default = True,
+    )
+
+    # Performance Properties
+
+    profileWithCProfile : BoolProperty(
+        name = "cProfile",
+        description = "Profile every operator and update with cProfile and keep the slowest functions. Makes the utilities slower",
+        default = False,
+    )
+
+    profileMemory : BoolProperty(
+        name = "Memory Peak",
+        description = "Trace the memory allocations of every operator and update with tracemalloc. Makes the utilities slower",
+        default = False,
+    )
@@ -0,0 +1,58 @@
+import bpy
+
+import time
+
+import traceback
+
+from bpy.app.handlers import persistent
+
+# Seconds a value has to stay unchanged before the full update runs
+DEBOUNCE_DELAY = 0.25
+
+class Debouncer:
+    '''Collapses rapid calls into one call per key after the calls stopped for the delay.
+    The calls run from bpy.app.timers, so they must get their context from bpy.context'''
+
+    def __init__(self):
+        # key -> (due time, function)
+        self.pending = {}
+        # bpy.app.timers compares functions by identity and every self.tick access creates a new bound method
+        self.tickFunction = self.tick
+
+    def schedule(self, key : str, function, delay : float = DEBOUNCE_DELAY):
+        '''Runs function after delay seconds, a newer call with the same key replaces it and starts the delay again'''
+        self.pending[key] = (time.monotonic() + delay, function)
+
+        if not bpy.app.timers.is_registered(self.tickFunction):
+            bpy.app.timers.register(self.tickFunction, first_interval=delay)
+
+    def tick(self):
+        now = time.monotonic()
+        for key, (due, function) in list(self.pending.items()):
+            if due <= now:
+                del self.pending[key]
+                try:
+                    function()
+                except Exception:
+                    traceback.print_exc()
+
+        if not self.pending:
+            return None
+        # Wake up again when the next call is due
+        return max(min(due for (due, _) in self.pending.values()) - now, 0.01)
+
+    def cancel(self, key : str):
+        self.pending.pop(key, None)
+
+    def clear(self):
+        self.pending.clear()
+
+        if bpy.app.timers.is_registered(self.tickFunction):
+            bpy.app.timers.unregister(self.tickFunction)
+
+debouncer = Debouncer()
+
+@persistent
+def clearTimersOnLoad(*args):
+    # Pending updates belong to the old file
+    debouncer.clear()
@@ -1,6 +1,11 @@
 import bpy
 
+import re
+
 from . eaw_utility_properties import EAWU_Properties
+from . eaw_utility_geometry import getCachedGeometry
+from . eaw_utility_profiling import profiler
+from . eaw_utility_core import (AXIS_INDICES, axisExtent, compileRenameTemplate, findClosestSourceIndices, mapParallel, templateUses)
 
 from bpy.types import (EditBone, Mesh)
 
@@ -15,6 +20,23 @@ def autoDetectLargestDigit(selectedBones : List[EditBone], startNumber : int, st
     return largestDigitSize
 
 
+def getRenameInputs(context, bones : List[EditBone], preset : str):
+    '''Parent names, armature space X locations and closest mesh names of the bones.
+    The closest meshes are only searched if the preset uses %m'''
+    parentNames = [bone.parent.name if bone.parent != None else "" for bone in bones]
+    xLocations = [bone.head.x for bone in bones]
+    meshNames = None
+
+    if templateUses(preset, "m"):
+        meshObjects = [obj for obj in context.scene.objects if obj.type == "MESH"]
+        geometry = [getCachedGeometry(context, obj) for obj in meshObjects]
+        armatureMatrix = context.object.matrix_world
+        closestIndices = findClosestSourceIndices([armatureMatrix @ bone.head for bone in bones],
+                                                  [meshGeometry.tree for meshGeometry in geometry])
+        meshNames = [meshObjects[index].name if index != None else "" for index in closestIndices]
+
+    return parentNames, xLocations, meshNames
+
 def adjustBoneNameByProperties(context, properties : EAWU_Properties, bone = None, i = 0):
     # Get Properties
     renameStartNumber = properties.renameStartNumber
@@ -26,94 +48,62 @@ def adjustBoneNameByProperties(context, properties : EAWU_Properties, bone = Non
     selectedBones = context.selected_bones
 
     if bone != None:
-        # Value for %s
-        currentBoneName = bone.name
-        currentNumber = renameStartNumber + (i * renameStepSizeNumber)
-        # Value for %i
-        currentNumberString = str(currentNumber)
-
         # Auto detect largestDigitSize
         if largestDigitSize == 0:
             largestDigitSize = autoDetectLargestDigit(selectedBones, renameStartNumber, renameStepSizeNumber)
+        if not fillUpZeros:
+            largestDigitSize = 0
 
-        # Fill up Zeros (if neccessary)
-        if fillUpZeros and len(currentNumberString) < largestDigitSize:
-            currentNumberString = "0" + str(currentNumber)
+        try:
+            formatter = compileRenameTemplate(renameBonePreset, renameStartNumber, renameStepSizeNumber, largestDigitSize, properties.renameMatchPattern)
+        except re.error:
+            return "Invalid Match Pattern"
 
-        return renameBonePreset.replace("%s", currentBoneName).replace("%i", currentNumberString)
+        parentNames, xLocations, meshNames = getRenameInputs(context, [bone], renameBonePreset)
+        return formatter(i, bone.name, parentNames[0], xLocations[0], meshNames[0] if meshNames != None else "")
     else:
         return "The supplied Bone is None"
 
-def lookAt(pos : Vector, target : Vector, up : Vector):
-    '''Only tested with 0,0,1 as the up vector. Other up vectors might give inaccurate results'''
-
-    d = target.normalized()
-    u = up.normalized()
-    # Modify Direction Vector
-    if up.z == 1: d.z *= -1
-    h = Vector((d.x, d.y, 0))
-
-    # Calculate Yaw
-    zAngle = atan2(d.y, d.x)
-    # Calculate Pitch
-    yAngle = asin(d.z)
-    # Calculate Roll
-    w0 = Vector((-d.y, d.x, 0))
-    u0 = Vector.cross(w0, d)
-    xAngle = atan2(Vector.dot(w0, u) / w0.length, Vector.dot(u0, u) / u0.length)
-
-    euler = Euler()
-    euler.x = xAngle
-    euler.y = yAngle
-    euler.z = zAngle
-
-    print("Rotation:", "X", degrees(euler.x), "Y", degrees(euler.y), "Z", degrees(euler.z))
-
-    return euler.to_matrix()
-
-def getModelLength(self, context, meshName, axis):
+def getModelLength(self, context, meshName, axis, useBoundingBox = False):
     scene = context.scene
     # Find correct Mesh
-    meshScale = 0
     outer = None
-    mesh : Mesh = None
     for obj in scene.objects:
-        if obj.data.name == meshName:
+        if obj.type == "MESH" and obj.data.name == meshName:
             outer = obj
-            mesh = Mesh(outer.data)
-            if axis == "X_AXIS":
-                meshScale = outer.scale.x
-            elif axis == "Y_AXIS":
-                meshScale = outer.scale.y
-            elif axis == "Z_AXIS":
-                meshScale = outer.scale.z
-    
-    longestDistance = 0
-    # Vertices pass 1
-    for vertex in mesh.vertices:
-        vertexLoc = Vector(outer.matrix_world @ vertex.co)
-        # Get axis Value 1
-        axisValue1 = 0
-        if axis == "X_AXIS":
-            axisValue1 = vertexLoc.x
-        elif axis == "Y_AXIS":
-            axisValue1 = vertexLoc.y
-        elif axis == "Z_AXIS":
-            axisValue1 = vertexLoc.z
-
-        # Vertices pass 2
-        for vertex2 in mesh.vertices:
-            vertexLoc2 = Vector(outer.matrix_world @ vertex2.co)
-            # Get axis Value 2
-            axisValue2 = 0
-            if axis == "X_AXIS":
-                axisValue2 = vertexLoc2.x
-            elif axis == "Y_AXIS":
-                axisValue2 = vertexLoc2.y
-            elif axis == "Z_AXIS":
-                axisValue2 = vertexLoc2.z
-
-            if abs(axisValue1 - axisValue2) > longestDistance:
-                longestDistance = abs(axisValue1 - axisValue2)
-    
-    return longestDistance / meshScale
\ No newline at end of file
+
+    if outer == None:
+        return 0
+
+    return getModelLengths(context, [outer], axis, useBoundingBox)[0]
+
+def getModelLengths(context, objects : list, axis, useBoundingBox = False) -> list:
+    '''Length of every mesh object on the axis without its scale, 0 for objects with a zero scale.
+    The vertex arrays are read or taken from the cache one after another, the extents are computed in parallel'''
+    axisIndex = AXIS_INDICES[axis]
+    lengths = [0.0] * len(objects)
+    measured = []
+    coordinates = []
+
+    for i, obj in enumerate(objects):
+        meshScale = obj.scale[axisIndex]
+        if meshScale == 0:
+            continue
+
+        matrix = obj.matrix_world
+        rotation = matrix.to_quaternion()
+        # Fast Mode: Without rotation the bounding box is aligned with the world axes
+        if useBoundingBox and abs(abs(rotation.w) - 1) < 1e-6:
+            axisValues = [corner[axisIndex] for corner in obj.bound_box]
+            lengths[i] = (max(axisValues) - min(axisValues)) * matrix.to_scale()[axisIndex] / meshScale
+        else:
+            # The cached world space coordinates are reused across runs
+            measured.append((i, meshScale))
+            coordinates.append(getCachedGeometry(context, obj).coordinates)
+            profiler.count("vertices", len(coordinates[-1]))
+
+    extents = mapParallel(lambda objectCoordinates: axisExtent(objectCoordinates, axisIndex), coordinates)
+    for (i, meshScale), extent in zip(measured, extents):
+        lengths[i] = extent / meshScale
+
+    return lengths
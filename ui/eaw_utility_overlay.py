@@ -0,0 +1,144 @@
+import bpy
+
+import gpu
+
+import numpy as np
+
+from bpy.app.handlers import persistent
+
+from gpu_extras.batch import batch_for_shader
+
+# Segments of every threshold ring
+CIRCLE_SEGMENTS = 32
+# Rings drawn while a slider is dragged, the full set is drawn once the value settled
+PREVIEW_RING_LIMIT = 256
+
+def getUniformColorShader():
+    # The 3D_ prefixed shader names were removed in Blender 4.0
+    try:
+        return gpu.shader.from_builtin("UNIFORM_COLOR")
+    except ValueError:
+        return gpu.shader.from_builtin("3D_UNIFORM_COLOR")
+
+def redrawViewports():
+    for window in bpy.context.window_manager.windows:
+        for area in window.screen.areas:
+            if area.type == "VIEW_3D":
+                area.tag_redraw()
+
+class ThresholdPreview:
+    '''Draws the distance threshold as rings around the parent bones in every 3D Viewport.
+    Nothing is added to the scene, an update only replaces the ring centers and the radius'''
+
+    def __init__(self):
+        self.handle = None
+        self.centers = np.empty((0, 3), dtype=np.float32)
+        self.radius = 0.0
+        self.color = (1.0, 0.6, 0.0, 1.0)
+        self.batch = None
+
+        # One unit circle on the XY plane, every ring is a scaled and moved copy
+        angles = np.linspace(0, 2 * np.pi, CIRCLE_SEGMENTS, endpoint=False)
+        self.unitCircle = np.stack((np.cos(angles), np.sin(angles), np.zeros(CIRCLE_SEGMENTS)), axis=1).astype(np.float32)
+        self.segmentIndices = np.stack((np.arange(CIRCLE_SEGMENTS), (np.arange(CIRCLE_SEGMENTS) + 1) % CIRCLE_SEGMENTS), axis=1)
+
+    def update(self, centers, radius : float, limit : int = None):
+        '''Shows rings with the radius around the world space centers, with a limit only an evenly spaced subset'''
+        if limit != None and len(centers) > limit:
+            centers = centers[np.linspace(0, len(centers) - 1, limit).astype(np.int64)]
+        self.centers = centers
+        self.radius = radius
+        self.batch = None
+
+        if self.handle == None:
+            self.handle = bpy.types.SpaceView3D.draw_handler_add(self.draw, (), "WINDOW", "POST_VIEW")
+        redrawViewports()
+
+    def clear(self):
+        self.centers = np.empty((0, 3), dtype=np.float32)
+        self.batch = None
+
+        if self.handle != None:
+            bpy.types.SpaceView3D.draw_handler_remove(self.handle, "WINDOW")
+            self.handle = None
+            redrawViewports()
+
+    def buildBatch(self, shader):
+        count = len(self.centers)
+        coordinates = (self.centers[:, np.newaxis, :] + self.unitCircle[np.newaxis, :, :] * self.radius).reshape(-1, 3)
+        indices = (self.segmentIndices[np.newaxis, :, :] + (np.arange(count) * CIRCLE_SEGMENTS)[:, np.newaxis, np.newaxis]).reshape(-1, 2)
+        return batch_for_shader(shader, "LINES", {"pos" : coordinates.tolist()}, indices=indices.tolist())
+
+    def draw(self):
+        if len(self.centers) == 0 or self.radius <= 0:
+            return
+
+        shader = getUniformColorShader()
+        if self.batch == None:
+            self.batch = self.buildBatch(shader)
+
+        # Draw in front like the old circle objects
+        gpu.state.depth_test_set("NONE")
+        shader.bind()
+        shader.uniform_float("color", self.color)
+        self.batch.draw(shader)
+
+thresholdPreview = ThresholdPreview()
+
+class PointsPreview:
+    '''Highlights points of one object in every 3D Viewport with a single batched draw call.
+    The points are in object space and drawn with the world matrix, moving the object needs no new batch'''
+
+    def __init__(self):
+        self.handle = None
+        self.objectName = None
+        self.points = np.empty((0, 3), dtype=np.float32)
+        self.color = (0.2, 0.8, 1.0, 1.0)
+        self.size = 8.0
+        self.batch = None
+
+    def update(self, obj, points):
+        '''Shows the object space points of obj, the batch is uploaded once on the next draw'''
+        self.objectName = obj.name
+        self.points = np.ascontiguousarray(points, dtype=np.float32)
+        self.batch = None
+
+        if self.handle == None:
+            self.handle = bpy.types.SpaceView3D.draw_handler_add(self.draw, (), "WINDOW", "POST_VIEW")
+        redrawViewports()
+
+    def clear(self):
+        self.objectName = None
+        self.points = np.empty((0, 3), dtype=np.float32)
+        self.batch = None
+
+        if self.handle != None:
+            bpy.types.SpaceView3D.draw_handler_remove(self.handle, "WINDOW")
+            self.handle = None
+            redrawViewports()
+
+    def draw(self):
+        obj = bpy.data.objects.get(self.objectName) if self.objectName != None else None
+        if obj == None or len(self.points) == 0:
+            return
+
+        shader = getUniformColorShader()
+        if self.batch == None:
+            self.batch = batch_for_shader(shader, "POINTS", {"pos" : self.points})
+
+        gpu.state.depth_test_set("NONE")
+        gpu.state.point_size_set(self.size)
+        gpu.matrix.push()
+        gpu.matrix.multiply_matrix(obj.matrix_world)
+        shader.bind()
+        shader.uniform_float("color", self.color)
+        self.batch.draw(shader)
+        gpu.matrix.pop()
+        gpu.state.point_size_set(1.0)
+
+bonesInRangePreview = PointsPreview()
+
+@persistent
+def clearOverlaysOnLoad(*args):
+    thresholdPreview.clear()
+    bonesInRangePreview.clear()
@@ -1,5 +1,7 @@
 import bpy
 
+from bpy.app.handlers import persistent
+
 from bpy.types import (Panel, Armature)
 
 from bpy.props import (StringProperty,
@@ -10,9 +12,65 @@ from bpy.props import (StringProperty,
 
 from ..eaw_utility_properties import EAWU_Properties
 from ..eaw_utility_util import (adjustBoneNameByProperties, autoDetectLargestDigit)
+from ..eaw_utility_geometry import getArmatureObjects
+from ..eaw_utility_profiling import profiler
 
 from mathutils import Vector
 
+# Timings listed in the Performance panel
+PERFORMANCE_PANEL_RECORDS = 15
+
+class PanelState:
+    '''Values derived for the panel, kept until the change counter moves. The counter is increased through
+    msgbus subscriptions (EAW Utility properties, active object, mode) and the depsgraph handler'''
+
+    def __init__(self):
+        self.changeCounter = 0
+        self.cachedCounter = -1
+        self.fingerprint = None
+        self.values = {}
+
+    def invalidate(self, *args):
+        self.changeCounter += 1
+
+    def track(self, fingerprint : tuple):
+        '''Cheap values read on every draw, a different fingerprint also invalidates the cache'''
+        if fingerprint != self.fingerprint:
+            self.fingerprint = fingerprint
+            self.invalidate()
+
+    def get(self, name : str, build):
+        if self.cachedCounter != self.changeCounter:
+            self.values.clear()
+            self.cachedCounter = self.changeCounter
+        if name not in self.values:
+            self.values[name] = build()
+        return self.values[name]
+
+panelState = PanelState()
+
+# Owner of the msgbus subscriptions
+msgbusOwner = object()
+
+def subscribePanelState():
+    bpy.msgbus.clear_by_owner(msgbusOwner)
+    for key in (EAWU_Properties, (bpy.types.LayerObjects, "active"), (bpy.types.Object, "mode")):
+        bpy.msgbus.subscribe_rna(key=key, owner=msgbusOwner, args=(), notify=panelState.invalidate)
+    panelState.invalidate()
+
+def unsubscribePanelState():
+    bpy.msgbus.clear_by_owner(msgbusOwner)
+
+@persistent
+def onDepsgraphUpdatePanel(scene, depsgraph):
+    # Selections, renames and edits of the bones
+    panelState.invalidate()
+
+@persistent
+def onLoadPostPanel(dummy):
+    # Subscriptions do not survive loading a file
+    subscribePanelState()
+
 class EAWU_PT_Panel(Panel):
 
     bl_space_type = "VIEW_3D"
@@ -27,6 +85,12 @@ class EAWU_PT_Panel(Panel):
 
         # Properties
         utilityProperty = properties.utilityProperty
+        # Derived values are cached until a property, the selection or the scene changes
+        activeObject = context.object
+        activeBone = context.active_bone
+        panelState.track((activeObject.name if activeObject != None else None, activeObject.mode if activeObject != None else None,
+                          activeBone.name if activeBone != None else None))
+        selectedBoneCount = panelState.get("selectedBoneCount", lambda: len(context.selected_bones) if context.selected_bones != None else None)
 
         # Adding a row at the end of each area will seperate them in the ui a bit 
 
@@ -41,6 +105,10 @@ class EAWU_PT_Panel(Panel):
             # Match bones and make them parent and child #
             ##############################################
 
+            # Armatures
+            row = layout.row()
+            row.prop(properties, "parentArmatureScope")
+            row = layout.row()
             # Distance Threshold
             row = layout.row()
             row.label(text="Distance Threshold:")
@@ -64,17 +132,20 @@ class EAWU_PT_Panel(Panel):
             row.label(text="Children Coverage: " + str(properties.childrenCoverage))
             row.prop(properties, "previewThreshold")
             row = layout.row()
+            # Coverage per Armature
+            if len(properties.armatureCoverage) > 1:
+                for item in properties.armatureCoverage:
+                    row = layout.row()
+                    row.label(text=item.armatureName + ": " + item.coverage, icon="ARMATURE_DATA")
+                row = layout.row()
             # Button
             row = layout.row()
             name = 'Parent Bones starting with "' + properties.parentBonesPrefix + '"'
-            # Get Armature
-            obj = context.object
-            if obj is not None:
-                if obj.type != "ARMATURE":
-                    name = "Select an Armature"
-            else:
+            # Get Armatures
+            if not panelState.get("hasParentArmatures", lambda: bool(getArmatureObjects(context, properties.parentArmatureScope))):
                 name = "Select an Armature"
-            row.operator("object.parent_all_bones", text=name)
+            row.prop(properties, "runInBackground", text="", icon="TIME")
+            row.operator("object.parent_all_bones_modal" if properties.runInBackground else "object.parent_all_bones", text=name)
 
         elif utilityProperty == "RANDOM_BONES":
             ###############################################
@@ -117,7 +188,7 @@ class EAWU_PT_Panel(Panel):
                 # Disable if to large
                 if obj.type == "ARMATURE":
                     armature = Armature(obj.data)
-                    if properties.randomBoneCount > len(armature.bones):
+                    if properties.randomBoneCount > panelState.get("boneCount", lambda: len(armature.bones)):
                         row.enabled = False
                 # Disable if minimumDistance causes infinit loop
                 if not properties.randomBonesButtonEnabled:
@@ -142,6 +213,12 @@ class EAWU_PT_Panel(Panel):
             row = layout.row()
             row.label(text="Use %s to preserve the original bone name.")
             row = layout.row()
+            row.label(text="Use %03i for a number with 3 digits, %p for the parent name,")
+            row = layout.row()
+            row.label(text="%S for the side (L, R or C), %m for the closest mesh,")
+            row = layout.row()
+            row.label(text="%1 to %9 for groups of the Match Pattern and %% for a %.")
+            row = layout.row()
             # Numbering
             row = layout.row()
             row.label(text="Start Number")
@@ -164,15 +241,17 @@ class EAWU_PT_Panel(Panel):
             row = layout.row()
             row.prop(properties, "renameBonePreset")
             row = layout.row()
+            row.prop(properties, "renameMatchPattern")
+            row = layout.row()
             # Preview
             row = layout.row()
             row.prop(properties, "enableRenamePreview")
-            if obj == None or context.selected_bones == None or len(context.selected_bones) == 0 or obj.type != "ARMATURE" or bpy.context.active_object.mode != "EDIT":
+            if obj == None or not selectedBoneCount or obj.type != "ARMATURE" or bpy.context.active_object.mode != "EDIT":
                 row.enabled = False
             else:
                 if properties.enableRenamePreview:
                     row = layout.row()
-                    row.label(text=self.calculateRenamePreview(context, properties))
+                    row.label(text=panelState.get("renamePreview", lambda: self.calculateRenamePreview(context, properties)))
                     if not properties.enableRenamePreview:
                         row.enabled = False
             row = layout.row()
@@ -181,7 +260,7 @@ class EAWU_PT_Panel(Panel):
             # Check if active object is armature
             name = "Rename Selected Bones"
             if obj is not None:
-                if context.selected_bones != None and len(context.selected_bones) == 0:
+                if selectedBoneCount == 0:
                     name = "Select a Bone in the Outliner"
                 if bpy.context.active_object.mode != "EDIT":
                     name = "Go into EDIT Mode (e.g. by pressing tab)"
@@ -218,6 +297,10 @@ class EAWU_PT_Panel(Panel):
                 row.prop(item, "value")
                 row.prop(item, "weight")
                 row = layout.row()
+            # Seed
+            row = layout.row()
+            row.prop(properties, "renameSeed")
+            row = layout.row()
             # Change Alamo Object Settings
             row = layout.row()
             row.prop(properties, "shouldChangeAlamoProperties")
@@ -227,7 +310,7 @@ class EAWU_PT_Panel(Panel):
             # Button name based on the neccessary conditions
             name = "Rename by Weight"
             if obj is not None:
-                if context.selected_bones != None and len(context.selected_bones) == 0:
+                if selectedBoneCount == 0:
                     name = "Select a Bone in the Outliner"
                 if bpy.context.active_object.mode != "EDIT":
                     name = "Go into EDIT Mode (e.g. by pressing tab)"
@@ -253,12 +336,15 @@ class EAWU_PT_Panel(Panel):
             row.prop(properties, "rotatingMethod")
             row = layout.row()
             # Change Panel Content based on rotation method
-            if rotatingMethod == "NORMAL_DIRECTION":
+            if rotatingMethod == "NORMAL_DIRECTION" or rotatingMethod == "SURFACE_NORMAL":
                 # Description
                 row = layout.row()
                 row.label(text="Method Properties:")
                 row = layout.row()
-                row.label(text="Rotate all selected bones in the normal direction of the closest vertex.")
+                if rotatingMethod == "NORMAL_DIRECTION":
+                    row.label(text="Rotate all selected bones in the normal direction of the closest vertex.")
+                else:
+                    row.label(text="Rotate all selected bones in the normal direction of the closest surface point.")
                 if properties.useNormalObject:
                     row = layout.row()
                     row.label(text="Select a specific mesh to find the closest normal")
@@ -285,12 +371,14 @@ class EAWU_PT_Panel(Panel):
                 row = layout.row()
                 row.prop(properties, "facingAxis")
                 row = layout.row()
+                row.prop(properties, "geometryCacheBudget")
+                row = layout.row()
             # Button Operator
             row = layout.row()
             # Button name based on the neccessary conditions
             name = "Rotate Bones"
             if obj is not None:
-                if context.selected_bones != None and len(context.selected_bones) == 0:
+                if selectedBoneCount == 0:
                     name = "Select a Bone in the Outliner"
                 if bpy.context.active_object.mode != "EDIT":
                     name = "Go into EDIT Mode (e.g. by pressing tab)"
@@ -300,7 +388,8 @@ class EAWU_PT_Panel(Panel):
                     name = "Choose a valid Mesh as Source Object"
             else:
                 name = "Select an Armature"
-            row.operator("object.rotate_bones", text=name)
+            row.prop(properties, "runInBackground", text="", icon="TIME")
+            row.operator("object.rotate_bones_modal" if properties.runInBackground else "object.rotate_bones", text=name)
         elif utilityProperty == "SCALE_CORRECT":
             ###########################
             # Scale the model correct #
@@ -317,21 +406,44 @@ class EAWU_PT_Panel(Panel):
             row.prop_search(properties, "refModel", bpy.data, "meshes")
             row = layout.row()
 
-            # Target Model Scale
+            # Targets
             row = layout.row()
-            row.label(text="Traget Model Length:")
-            row.prop(properties, "targetModelLength")
+            row.prop(properties, "scaleTargetSource", expand=True)
             row = layout.row()
 
-            row = layout.row()
-            row.label(text="Target Model:")
-            row.prop_search(properties, "targetModel", bpy.data, "meshes")
-            row = layout.row()
+            # Target Model Scale
+            if properties.scaleTargetSource != "CSV":
+                row = layout.row()
+                row.label(text="Traget Model Length:")
+                row.prop(properties, "targetModelLength")
+                row = layout.row()
+
+            if properties.scaleTargetSource == "SINGLE":
+                row = layout.row()
+                row.label(text="Target Model:")
+                row.prop_search(properties, "targetModel", bpy.data, "meshes")
+                row = layout.row()
+            elif properties.scaleTargetSource == "COLLECTION":
+                row = layout.row()
+                row.label(text="Target Collection:")
+                row.prop_search(properties, "targetCollection", bpy.data, "collections")
+                row = layout.row()
+                row.prop(properties, "targetLengthProperty")
+                row = layout.row()
+            else:
+                row = layout.row()
+                row.label(text="Target CSV File:")
+                row.prop(properties, "targetCSVPath")
+                row = layout.row()
 
             # Length Axis
             row = layout.row()
             row.prop(properties, "lengthAxis")
             row = layout.row()
+            row.prop(properties, "useBoundingBoxLength")
+            row = layout.row()
+            row.prop(properties, "geometryCacheBudget")
+            row = layout.row()
 
             row = layout.row()
             row.label(text="It is important to APPLY THE SCALE of the target model before you use this method.")
@@ -343,13 +455,47 @@ class EAWU_PT_Panel(Panel):
             name = "Scale by Reference"
             if properties.refModel == "":
                 name = "Select a target mesh"
-            elif properties.targetModel == "":
+            elif properties.scaleTargetSource == "SINGLE" and properties.targetModel == "":
                 name = "Select a reference mesh"
+            elif properties.scaleTargetSource == "COLLECTION" and properties.targetCollection == "":
+                name = "Select a target collection"
+            elif properties.scaleTargetSource == "CSV" and properties.targetCSVPath == "":
+                name = "Select a target CSV file"
             elif properties.refModelLength == 0:
                 name = "The reference length can not be 0"
-            elif properties.targetModelLength == 0:
+            elif properties.scaleTargetSource == "SINGLE" and properties.targetModelLength == 0:
                 name = "The target length can not be 0"
-            row.operator("object.scale_by_reference", text=name)
+            row.prop(properties, "runInBackground", text="", icon="TIME")
+            row.operator("object.scale_by_reference_modal" if properties.runInBackground else "object.scale_by_reference", text=name)
+        elif utilityProperty == "PIPELINE":
+            ###############################################
+            # Run several steps in one Edit Mode session  #
+            ###############################################
+
+            # Get Armature Object
+            obj = context.object
+            # Description
+            row = layout.row()
+            row.label(text="The steps run in this order with the options of their utility.")
+            row = layout.row()
+            # Steps
+            row = layout.row()
+            row.prop(properties, "pipelineParent")
+            row = layout.row()
+            row.prop(properties, "pipelineSelectRandom")
+            row = layout.row()
+            row.prop(properties, "pipelineRename")
+            row = layout.row()
+            row.prop(properties, "pipelineRenameByWeight")
+            row = layout.row()
+            row.prop(properties, "pipelineRotate")
+            row = layout.row()
+            # Button Operator
+            row = layout.row()
+            name = "Run Pipeline"
+            if obj is None or obj.type != "ARMATURE":
+                name = "Select an Armature"
+            row.operator("object.run_eaw_pipeline", text=name)
 
     def calculateRenamePreview(self, context, properties : EAWU_Properties, bone = None):
         selectedBones = context.selected_bones
@@ -363,4 +509,40 @@ class EAWU_PT_Panel(Panel):
             if bone == None:
                 bone = selectedBones[0]
 
-            return adjustBoneNameByProperties(context, properties, bone)
\ No newline at end of file
+            return adjustBoneNameByProperties(context, properties, bone)
+
+class EAWU_PT_PerformancePanel(Panel):
+
+    bl_space_type = "VIEW_3D"
+    bl_region_type = "UI"
+    bl_label = "Performance"
+    bl_category = "EAW Utility"
+    bl_parent_id = "EAWU_PT_Panel"
+    bl_options = {"DEFAULT_CLOSED"}
+
+    def draw(self, context):
+        layout = self.layout
+        scene = context.scene
+        properties = EAWU_Properties(scene.eaw_utility)
+
+        # Optional Profilers
+        row = layout.row()
+        row.prop(properties, "profileWithCProfile")
+        row.prop(properties, "profileMemory")
+        row = layout.row()
+        # Latest Timings
+        records = list(profiler.records)[-PERFORMANCE_PANEL_RECORDS:]
+        if not records:
+            row = layout.row()
+            row.label(text="No timings recorded yet")
+        for record in reversed(records):
+            row = layout.row()
+            text = record.summary()
+            if record.memoryPeak != None:
+                text += ", peak " + str(record.memoryPeak // 1024) + " KB"
+            row.label(text=text, icon="PLAY" if record.kind == "operator" else "PROPERTIES")
+        row = layout.row()
+        # Buttons
+        row = layout.row()
+        row.operator("object.export_eaw_profile", icon="EXPORT")
+        row.operator("object.clear_eaw_profile", icon="TRASH")